@@ -0,0 +1,103 @@
+"""
+Throughput benchmark of DALL-E variation preprocessing, threads against `ImagePreprocessor`.
+
+Both paths run `prepare_for_dalle` on the same generated images. A ticker task measures how late
+the event loop wakes up meanwhile, which is what the gateway connection feels while PIL holds the
+GIL.
+
+    python -m benchmarks.preprocess --images 32 --size 2048
+"""
+
+import argparse
+import asyncio
+import io
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image as PILImage
+
+from core.image.preprocess import ImagePreprocessor, prepare_for_dalle
+
+TICK = 0.01
+
+
+def make_image(size: int) -> bytes:
+    # Noise doesn't compress, so this is close to the worst case for the PNG encoder.
+    img = PILImage.frombytes("RGB", (size, size), os.urandom(size * size * 3))
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+
+    return buf.getvalue()
+
+
+async def ticker(lags: list[float], stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append(time.perf_counter() - start - TICK)
+
+
+async def run(mode: str, images: list[bytes], workers: int) -> dict[str, float]:
+    loop = asyncio.get_running_loop()
+
+    if mode == "threads":
+        executor = ThreadPoolExecutor(max_workers=workers)
+
+        def prepare(data):
+            return loop.run_in_executor(executor, prepare_for_dalle, data)
+
+    else:
+        ImagePreprocessor.MAX_WORKERS = workers
+        preprocessor = ImagePreprocessor()
+        # Start the workers before timing, the pool lives as long as the bot does.
+        await asyncio.gather(
+            *[preprocessor.prepare_for_dalle(images[0], 256) for _ in range(workers)]
+        )
+        prepare = preprocessor.prepare_for_dalle
+
+    lags = []
+    stop = asyncio.Event()
+    tick = asyncio.create_task(ticker(lags, stop))
+
+    try:
+        start = time.perf_counter()
+        await asyncio.gather(*[prepare(data) for data in images])
+        elapsed = time.perf_counter() - start
+    finally:
+        stop.set()
+        await tick
+
+        if mode == "threads":
+            executor.shutdown()
+        else:
+            ImagePreprocessor.shutdown()
+
+    lags = [i * 1000 for i in lags]
+
+    return {
+        "images/s": len(images) / elapsed,
+        "loop lag mean (ms)": statistics.fmean(lags),
+        "loop lag max (ms)": max(lags),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--images", type=int, default=32)
+    parser.add_argument("--size", type=int, default=2048)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    images = [make_image(args.size) for _ in range(args.images)]
+
+    for mode in ("threads", "processes"):
+        stats = await run(mode, images, args.workers)
+        print(
+            f"{mode:>9}: " + ", ".join(f"{k} {v:.1f}" for k, v in stats.items())
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
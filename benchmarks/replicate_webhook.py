@@ -0,0 +1,236 @@
+"""
+Offline latency benchmark of `Replicate.run(wait=True)`, polling against the webhook receiver.
+
+A local stand-in for the Replicate API finishes each prediction after a random delay and delivers
+a signed completion webhook, so no API token or network access is needed. The reported latency is
+how long after a prediction finished the client noticed it. It first checks that a delivery
+signed too long ago (a replay) is rejected by the receiver.
+
+    python -m benchmarks.replicate_webhook --predictions 20
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import os
+import random
+import statistics
+import time
+import uuid
+
+import aiohttp
+import yarl
+from aiohttp import web
+
+from core.replicate import Replicate, ReplicateWebhook
+
+HOST = "127.0.0.1"
+SECRET = "whsec_" + base64.b64encode(os.urandom(24)).decode()
+
+
+class FakeReplicate:
+    """
+    Just enough of `POST /predictions`, `GET /predictions` and `GET /predictions/{id}`.
+    """
+
+    def __init__(self, *, delay: tuple[float, float], session: aiohttp.ClientSession):
+        self.delay = delay
+        self.session = session
+
+        self.predictions: dict[str, dict] = {}
+        self.finished_at: dict[str, float] = {}
+        self.requests = 0
+        self._tasks: set[asyncio.Task] = set()
+        self._runner: web.AppRunner | None = None
+
+    async def start(self, port: int) -> str:
+        app = web.Application(middlewares=[self._count])
+        app.router.add_post("/v1/predictions", self._create)
+        app.router.add_get("/v1/predictions", self._list)
+        app.router.add_get("/v1/predictions/{id}", self._get)
+
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, HOST, port).start()
+
+        return f"http://{HOST}:{port}/v1/"
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+
+        await self._runner.cleanup()
+
+    @web.middleware
+    async def _count(self, request, handler):
+        self.requests += 1
+        return await handler(request)
+
+    async def _create(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        prediction = {
+            "id": uuid.uuid4().hex,
+            "version": body["version"],
+            "model": "fake/model",
+            "status": "starting",
+            "input": body["input"],
+            "output": None,
+        }
+        self.predictions[prediction["id"]] = prediction
+
+        task = asyncio.create_task(self._finish(prediction, body.get("webhook")))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+        return web.json_response(prediction, status=201)
+
+    async def _finish(self, prediction: dict, webhook: str | None) -> None:
+        await asyncio.sleep(random.uniform(*self.delay))
+
+        prediction["status"] = "succeeded"
+        prediction["output"] = [f"https://example.com/{prediction['id']}.png"]
+        self.finished_at[prediction["id"]] = time.perf_counter()
+
+        if webhook:
+            if (status := await self._deliver(webhook, prediction)) >= 400:
+                raise RuntimeError(f"Webhook delivery was rejected ({status}).")
+
+    async def _deliver(self, url: str, prediction: dict, *, age: float = 0) -> int:
+        """
+        POST a signed completion webhook, `age` seconds old. Returns the response status.
+        """
+        body = json.dumps(prediction).encode()
+        webhook_id = f"msg_{uuid.uuid4().hex}"
+        timestamp = str(int(time.time() - age))
+
+        key = base64.b64decode(SECRET.removeprefix("whsec_"))
+        content = f"{webhook_id}.{timestamp}.".encode() + body
+        signature = base64.b64encode(
+            hmac.new(key, content, hashlib.sha256).digest()
+        ).decode()
+
+        headers = {
+            "Content-Type": "application/json",
+            "webhook-id": webhook_id,
+            "webhook-timestamp": timestamp,
+            "webhook-signature": f"v1,{signature}",
+        }
+
+        async with self.session.post(url, data=body, headers=headers) as resp:
+            return resp.status
+
+    async def _list(self, request: web.Request) -> web.Response:
+        results = list(reversed(self.predictions.values()))
+        return web.json_response({"results": results, "next": None})
+
+    async def _get(self, request: web.Request) -> web.Response:
+        return web.json_response(self.predictions[request.match_info["id"]])
+
+
+async def run(
+    mode: str, n: int, delay: tuple[float, float], port: int
+) -> dict[str, float]:
+    async with aiohttp.ClientSession() as session:
+        fake = FakeReplicate(delay=delay, session=session)
+        base_url = await fake.start(port)
+
+        webhook = None
+
+        if mode == "webhook":
+            webhook = ReplicateWebhook(
+                f"http://{HOST}:{port + 1}/replicate/webhook",
+                host=HOST,
+                port=port + 1,
+                secret=SECRET,
+            )
+            await webhook.start()
+
+        replicate = Replicate("fake-token", session=session, webhook=webhook)
+        replicate.BASE_URL = yarl.URL(base_url)
+
+        async def one() -> float:
+            prediction = await replicate.run("fake/model:v1", prompt="benchmark")
+            return time.perf_counter() - fake.finished_at[prediction.id]
+
+        try:
+            start = time.perf_counter()
+            latencies = await asyncio.gather(*[one() for _ in range(n)])
+            elapsed = time.perf_counter() - start
+        finally:
+            if webhook:
+                await webhook.close()
+
+            await fake.close()
+
+    latencies = [i * 1000 for i in latencies]
+
+    return {
+        "wall (s)": elapsed,
+        "mean (ms)": statistics.fmean(latencies),
+        "p95 (ms)": (
+            statistics.quantiles(latencies, n=20)[-1] if n > 1 else latencies[0]
+        ),
+        "requests": fake.requests,
+    }
+
+
+async def check_replay(port: int) -> None:
+    """
+    A delivery signed too long ago (e.g. a captured one being replayed) has to be rejected.
+    """
+    async with aiohttp.ClientSession() as session:
+        fake = FakeReplicate(delay=(0, 0), session=session)
+        webhook = ReplicateWebhook(
+            f"http://{HOST}:{port}/replicate/webhook", host=HOST, port=port, secret=SECRET
+        )
+        await webhook.start()
+
+        prediction = {
+            "id": uuid.uuid4().hex,
+            "version": "v1",
+            "model": "fake/model",
+            "status": "succeeded",
+            "output": ["https://example.com/replayed.png"],
+        }
+
+        try:
+            fresh = await fake._deliver(webhook.url, prediction)
+            stale = await fake._deliver(
+                webhook.url, prediction, age=webhook.TIMESTAMP_TOLERANCE + 60
+            )
+        finally:
+            await webhook.close()
+
+    assert fresh == 204, f"fresh delivery got {fresh}"
+    assert stale == 401, f"stale delivery got {stale}"
+    print(f"  replay: fresh delivery {fresh}, stale delivery {stale}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--predictions", type=int, default=20)
+    parser.add_argument("--min-delay", type=float, default=0.5)
+    parser.add_argument("--max-delay", type=float, default=3.0)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    delay = (args.min_delay, args.max_delay)
+
+    await check_replay(args.port + 1)
+
+    for mode in ("polling", "webhook"):
+        stats = await run(mode, args.predictions, delay, args.port)
+        print(
+            f"{mode:>8}: "
+            + ", ".join(
+                f"{k} {v:.1f}" if isinstance(v, float) else f"{k} {v}"
+                for k, v in stats.items()
+            )
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,122 @@
+"""
+Latency benchmark of the Spotify access token exchange, a `curl` subprocess per fetch (the old
+path) against the pooled aiohttp request in `SpotifyClient.get_access_token`.
+
+Both paths hit a local stand-in for `open.spotify.com/get_access_token` under concurrent lyrics
+lookups, so no Spotify cookies or network access are needed. Needs `curl` on the PATH.
+
+    python -m benchmarks.spotify_token --lookups 200 --concurrency 20
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import aiohttp
+from aiohttp import web
+
+from core.music.spotify.spotify_client import SpotifyClient
+
+HOST = "127.0.0.1"
+SP_DC = "benchmark-sp-dc"
+SP_KEY = "benchmark-sp-key"
+
+
+async def start_server(port: int, delay: float) -> web.AppRunner:
+    async def get_access_token(request: web.Request) -> web.Response:
+        await asyncio.sleep(delay)
+
+        return web.json_response(
+            {
+                "clientId": "benchmark",
+                "accessToken": "token",
+                "accessTokenExpirationTimestampMs": int((time.time() + 3600) * 1000),
+                "isAnonymous": request.cookies.get("sp_dc") != SP_DC,
+            }
+        )
+
+    app = web.Application()
+    app.router.add_get("/get_access_token", get_access_token)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, HOST, port).start()
+
+    return runner
+
+
+async def curl_token(url: str) -> str:
+    # What SpotifyClient.get_access_token used to do.
+    command = f'curl --silent --cookie "sp_dc={SP_DC}" --cookie "sp_key={SP_KEY}" {url}'
+    proc = await asyncio.create_subprocess_shell(
+        command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    stdout, _ = await proc.communicate()
+
+    return json.loads(stdout.decode("utf-8"))["accessToken"]
+
+
+async def run(mode: str, url: str, lookups: int, concurrency: int) -> dict[str, float]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with aiohttp.ClientSession() as session:
+        client = SpotifyClient(SP_DC, SP_KEY, session=session)
+        client.ACCESS_TOKEN_URL = url
+
+        async def fetch():
+            if mode == "curl":
+                return await curl_token(url)
+
+            return (await client.get_access_token(sp_dc=SP_DC, sp_key=SP_KEY))[0]
+
+        async def one() -> float:
+            async with semaphore:
+                start = time.perf_counter()
+                await fetch()
+                return time.perf_counter() - start
+
+        try:
+            await fetch()  # Warm up, the pooled path opens its connection once.
+
+            start = time.perf_counter()
+            latencies = await asyncio.gather(*[one() for _ in range(lookups)])
+            elapsed = time.perf_counter() - start
+        finally:
+            await client.close()
+
+    latencies = [i * 1000 for i in latencies]
+
+    return {
+        "lookups/s": lookups / elapsed,
+        "mean (ms)": statistics.fmean(latencies),
+        "p95 (ms)": (
+            statistics.quantiles(latencies, n=20)[-1] if lookups > 1 else latencies[0]
+        ),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--lookups", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--delay", type=float, default=0.0, help="Server latency (s)")
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+
+    runner = await start_server(args.port, args.delay)
+    url = f"http://{HOST}:{args.port}/get_access_token"
+
+    try:
+        for mode in ("curl", "pooled"):
+            stats = await run(mode, url, args.lookups, args.concurrency)
+            print(
+                f"{mode:>6}: " + ", ".join(f"{k} {v:.1f}" for k, v in stats.items())
+            )
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
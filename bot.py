@@ -1,4 +1,6 @@
 from core.bot import Bot
 
-bot = Bot()
-bot.run()
+# Guarded because the image preprocessing pool's workers (forkserver/spawn) re-import this module.
+if __name__ == "__main__":
+    bot = Bot()
+    bot.run()
@@ -19,8 +19,10 @@ from rich.traceback import install as install_rich_traceback
 
 import config as cfg
 from core.context import Context
+from core.image.preprocess import ImagePreprocessor
 from core.openai import OpenAI
 from core.ping import Ping
+from core.replicate import Replicate, ReplicateWebhook
 from utils.app_commands import CommandTree
 from utils.translator import Translator
 
@@ -64,6 +66,7 @@ class Bot(commands.Bot):
     cdn: S3Client
     pool: asyncpg.Pool
     ping: Ping
+    replicate_webhook: ReplicateWebhook | None
 
     def __init__(self, command_prefix: typing.Any = None, *args, **kwargs):
         self.connected = False
@@ -146,6 +149,24 @@ class Bot(commands.Bot):
 
         self.ping = Ping(self)
 
+        # Replicate webhook receiver, falls back to polling predictions when not configured.
+        self.replicate_webhook = None
+        replicate_webhook_url = getattr(cfg, "REPLICATE_WEBHOOK_URL", None)
+        replicate_webhook_secret = getattr(cfg, "REPLICATE_WEBHOOK_SECRET", None)
+
+        if replicate_webhook_url and not replicate_webhook_secret:
+            print("REPLICATE_WEBHOOK_SECRET is not set, polling Replicate predictions instead.")
+        elif replicate_webhook_url:
+            self.replicate_webhook = ReplicateWebhook(
+                replicate_webhook_url,
+                host=getattr(cfg, "REPLICATE_WEBHOOK_HOST", "0.0.0.0"),
+                port=getattr(cfg, "REPLICATE_WEBHOOK_PORT", 8080),
+                secret=replicate_webhook_secret,
+            )
+            await self.replicate_webhook.start()
+
+            Replicate.WEBHOOK = self.replicate_webhook
+
         # print("Setting up translator")
         # await self.tree.set_translator(Translator(self))
 
@@ -167,6 +188,15 @@ class Bot(commands.Bot):
         if not self.is_selfhosted:
             sentry_sdk.init(cfg.SENTRY_DSN, traces_sample_rate=1.0)
 
+    async def close(self) -> None:
+        if getattr(self, "replicate_webhook", None):
+            await self.replicate_webhook.close()
+            Replicate.WEBHOOK = None
+
+        ImagePreprocessor.shutdown()
+
+        await super().close()
+
     def run(self, token: str = None, *args, **kwargs) -> None:
         token = token or self.token
         super().run(token, *args, **kwargs)
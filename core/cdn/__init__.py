@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import asyncio
+import io
+import mimetypes
+import typing
+
+import aiohttp
+
+from core.fetch import sniff
+
+if typing.TYPE_CHECKING:
+    from core.image.preprocess import ImagePreprocessor
+
+
+def thumbnail_key(key: str) -> str:
+    """
+    Where the thumbnail of an image uploaded with `CDN.upload_image` is, e.g. `a/1.webp` -> `a/1.thumb.webp`.
+    """
+    return key.rpartition(".")[0] + ".thumb.webp"
+
+
+def thumbnail_url(url: str) -> str | None:
+    """
+    The thumbnail URL of an image uploaded with `CDN.upload_image`, `None` if it doesn't have one.
+    """
+    if url.endswith(".webp") and not url.endswith(".thumb.webp"):
+        return thumbnail_key(url)
+
+    return None
+
+
+class CDN:
+    """
+    Uploads to the bot's S3 (R2) bucket.
+
+    boto3 is blocking, so uploads run in a thread instead of stalling the event loop. With a
+    `preprocessor`, images uploaded through `upload_image` are re-encoded to WebP in its process pool.
+    """
+
+    def __init__(
+        self,
+        s3,
+        bucket: str,
+        host: str,
+        *,
+        preprocessor: ImagePreprocessor = None,
+    ):
+        self.s3 = s3
+        self.bucket = bucket
+        self.host = host
+        self.preprocessor = preprocessor
+
+    def url_for(self, key: str) -> str:
+        return f"{self.host}/{key}"
+
+    async def upload(
+        self,
+        data: bytes | typing.BinaryIO,
+        key: str,
+        *,
+        content_type: str = None,
+    ) -> str:
+        """
+        Upload `data` to `key`, returns its public URL.
+        """
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            data = io.BytesIO(data)
+
+        extra_args = {"ContentType": content_type} if content_type else None
+
+        await asyncio.to_thread(
+            self.s3.upload_fileobj, data, self.bucket, key, ExtraArgs=extra_args
+        )
+
+        return self.url_for(key)
+
+    async def mirror(
+        self,
+        session: aiohttp.ClientSession,
+        url: str,
+        key: str,
+        *,
+        content_type: str = None,
+    ) -> str:
+        """
+        Download `url` and upload it to `key`, returns the new URL.
+        """
+        async with session.get(url) as resp:
+            resp.raise_for_status()
+            data = await resp.read()
+
+        return await self.upload(data, key, content_type=content_type)
+
+    async def upload_image(self, data: bytes | typing.BinaryIO, name: str) -> str:
+        """
+        Upload an image to `name` plus its extension, returns its URL.
+
+        With a preprocessor the image is stored as WebP with a thumbnail next to it (`thumbnail_key`),
+        otherwise (or if it can't be re-encoded) it's uploaded as-is.
+        """
+        if not isinstance(data, (bytes, bytearray, memoryview)):
+            data = data.read()
+
+        if self.preprocessor is not None:
+            try:
+                full, thumbnail = await self.preprocessor.encode_for_cdn(data)
+            except Exception:
+                pass  # Not something PIL can re-encode, upload the original.
+            else:
+                key = f"{name}.webp"
+
+                await asyncio.gather(
+                    self.upload(full, key, content_type="image/webp"),
+                    self.upload(
+                        thumbnail, thumbnail_key(key), content_type="image/webp"
+                    ),
+                )
+
+                return self.url_for(key)
+
+        content_type = sniff(data) or "image/png"
+        extension = mimetypes.guess_extension(content_type) or ".png"
+
+        return await self.upload(data, name + extension, content_type=content_type)
+
+    async def mirror_image(
+        self, session: aiohttp.ClientSession, url: str, name: str
+    ) -> str:
+        """
+        Download the image at `url` and upload it with `upload_image`.
+        """
+        async with session.get(url) as resp:
+            resp.raise_for_status()
+            data = await resp.read()
+
+        return await self.upload_image(data, name)
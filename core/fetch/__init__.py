@@ -0,0 +1,151 @@
+import asyncio
+from dataclasses import dataclass
+
+import aiohttp
+import cachetools
+
+# (offset, magic bytes, content type)
+MAGIC_BYTES = [
+    (0, b"\x89PNG\r\n\x1a\n", "image/png"),
+    (0, b"\xff\xd8\xff", "image/jpeg"),
+    (0, b"GIF87a", "image/gif"),
+    (0, b"GIF89a", "image/gif"),
+    (8, b"WEBP", "image/webp"),
+    (0, b"BM", "image/bmp"),
+    (0, b"II*\x00", "image/tiff"),
+    (0, b"MM\x00*", "image/tiff"),
+    (4, b"ftypavif", "image/avif"),
+    (4, b"ftypheic", "image/heic"),
+    (0, b"ID3", "audio/mpeg"),
+    (0, b"\xff\xfb", "audio/mpeg"),
+    (0, b"\xff\xf3", "audio/mpeg"),
+    (0, b"\xff\xf2", "audio/mpeg"),
+    (0, b"OggS", "audio/ogg"),
+    (0, b"fLaC", "audio/flac"),
+    (8, b"WAVE", "audio/wav"),
+    (4, b"ftypM4A", "audio/mp4"),
+    (4, b"ftyp", "video/mp4"),
+]
+
+
+def sniff(data: bytes) -> str | None:
+    """
+    Guess the content type of `data` from its magic bytes.
+    """
+    for offset, magic, content_type in MAGIC_BYTES:
+        if data[offset : offset + len(magic)] == magic:
+            return content_type
+
+    return None
+
+
+class FetchError(Exception):
+    pass
+
+
+class FileTooLarge(FetchError):
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+
+        super().__init__(
+            f"File is too large, the maximum size is {max_bytes / 1024 / 1024:g} MB."
+        )
+
+
+class UnsupportedFile(FetchError):
+    def __init__(self, content_type: str | None):
+        self.content_type = content_type
+
+        super().__init__(f"Unsupported file type: `{content_type or 'unknown'}`.")
+
+
+@dataclass(frozen=True)
+class FetchResult:
+    url: str
+    data: bytes
+    content_type: str | None
+
+
+class Fetcher:
+    """
+    Downloads files from URLs with a size limit.
+
+    The body is streamed and the download stops as soon as it goes over `max_bytes`. Results are
+    kept for a short while keyed by URL, so an attachment used by several commands is only
+    downloaded once.
+    """
+
+    MAX_BYTES = 10 * 1024 * 1024
+    CHUNK_SIZE = 64 * 1024
+    CACHE = cachetools.TTLCache(
+        maxsize=64 * 1024 * 1024, ttl=5 * 60, getsizeof=lambda r: len(r.data)
+    )
+    _INFLIGHT: dict[tuple[str, int], asyncio.Task] = {}
+
+    def __init__(self, session: aiohttp.ClientSession, *, max_bytes: int = None):
+        self.session = session
+        self.max_bytes = max_bytes or self.MAX_BYTES
+
+    async def _download(self, url: str, max_bytes: int) -> FetchResult:
+        async with self.session.get(url) as resp:
+            if resp.status >= 400:
+                raise FetchError(f"Could not download file ({resp.status}).")
+
+            if resp.content_length is not None and resp.content_length > max_bytes:
+                raise FileTooLarge(max_bytes)
+
+            data = bytearray()
+
+            async for chunk in resp.content.iter_chunked(self.CHUNK_SIZE):
+                data.extend(chunk)
+
+                if len(data) > max_bytes:
+                    raise FileTooLarge(max_bytes)
+
+            data = bytes(data)
+
+            return FetchResult(url, data, sniff(data) or resp.content_type)
+
+    async def fetch(
+        self,
+        url: str,
+        *,
+        max_bytes: int = None,
+        types: tuple[str, ...] = None,
+        cache: bool = True,
+    ) -> FetchResult:
+        """
+        Download `url`. `types` are the allowed content type prefixes, e.g. `("image/",)`.
+        """
+        max_bytes = max_bytes or self.max_bytes
+
+        result = self.CACHE.get(url) if cache else None
+
+        if not cache:
+            # Wants its own download, don't join (or hand out) a shared one.
+            result = await self._download(url, max_bytes)
+        elif result is None:
+            # Same URL being downloaded already (e.g. the same attachment on two commands). Keyed by
+            # the limit too, or a smaller limit would fail a caller that allows more.
+            key = (url, max_bytes)
+
+            if not (task := self._INFLIGHT.get(key)):
+                task = asyncio.create_task(self._download(url, max_bytes))
+                self._INFLIGHT[key] = task
+                task.add_done_callback(lambda _: self._INFLIGHT.pop(key, None))
+
+            result = await asyncio.shield(task)
+
+            if len(result.data) <= self.CACHE.maxsize:
+                self.CACHE[url] = result
+
+        if len(result.data) > max_bytes:
+            raise FileTooLarge(max_bytes)
+
+        if types and not (result.content_type or "").startswith(types):
+            raise UnsupportedFile(result.content_type)
+
+        return result
+
+    async def read(self, url: str, **kwargs) -> bytes:
+        return (await self.fetch(url, **kwargs)).data
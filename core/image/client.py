@@ -1,20 +1,44 @@
-import asyncio
+import datetime
+import hashlib
 import io
+import json
+import time
+import typing
 import uuid
 
 import aiohttp
+import asyncpg
+import cachetools
 import openai
 
+from core.cdn import CDN
+from core.moderation import wait_for_approval
+
 from .dataclass import AnalyzeResult
 from .enums import *
 from .firefly import *
 from .image import *
 from .midjourney import *
+from .preprocess import ImagePreprocessor
+from .stream import iter_completed
 from .style import *
 
 
 class ImageUtilities:
-    def __init__(self, s3, session: aiohttp.ClientSession, keys: tuple[str]):
+    # Analysis results by SHA-256 of the image, backed by the `image_analysis` table.
+    ANALYZE_CACHE = cachetools.LRUCache(maxsize=512)
+    ANALYZE_TTL = datetime.timedelta(days=30)
+    # "b64_json" has OpenAI send the image in the response instead of a URL we'd download it from.
+    RESPONSE_FORMAT = "b64_json"
+
+    def __init__(
+        self,
+        s3,
+        session: aiohttp.ClientSession,
+        keys: tuple[str],
+        *,
+        pool: asyncpg.Pool = None,
+    ):
         self.openai_key = keys[0]
         openai.api_key = keys[0]
         self.dream_key = keys[1]
@@ -23,20 +47,21 @@ class ImageUtilities:
 
         self.s3, self.bucket, self.host = s3
         self.session = session
+        self.pool = pool
         self.client = openai.AsyncOpenAI(api_key=self.openai_key)
+        self.preprocessor = ImagePreprocessor()
+        self.cdn = CDN(*s3, preprocessor=self.preprocessor)
 
     @property
     def style(self):
-        return GenerateStyleArt(
-            (self.s3, self.bucket, self.host), self.session, self.dream_key
-        )
+        return GenerateStyleArt(self.cdn, self.session, self.dream_key)
 
     @property
     def midjourney(self):
         return Midjourney(
             self.replicate_key,
             session=self.session,
-            cdn=(self.s3, self.bucket, self.host),
+            cdn=self.cdn,
         )
 
     @property
@@ -44,7 +69,7 @@ class ImageUtilities:
         return Firefly(
             self.firefly_key,
             session=self.session,
-            cdn=(self.s3, self.bucket, self.host),
+            cdn=self.cdn,
         )
 
     def _get_headers(self):
@@ -53,50 +78,90 @@ class ImageUtilities:
             "Content-Type": "application/json",
         }
 
-    async def _upload_to_cdn(self, gen: GeneratedImages):
-        # Read the url in gen.images[].url and upload it to boto3 S3 client.
-
-        counter = 1
-        img_id = uuid.uuid4()
-
-        for image in gen.images:
-            original_url = image.url
+    async def _upload_image(self, image: GeneratedImage, name: str):
+        if image.buffer is not None:
+            url = await self.cdn.upload_image(image.buffer, name)
+        else:
+            url = await self.cdn.mirror_image(self.session, image.url, name)
 
-            async with self.session.get(original_url) as resp:
-                data = await resp.read()
+        image._set_uploaded(url)
 
-            # Upload to S3
-            self.s3.upload_fileobj(
-                io.BytesIO(data),
-                Bucket=self.bucket,
-                Key=f"dalle2-results/{img_id}/{counter}.png",
-            )
-
-            image.url = f"{self.host}/dalle3-results/{img_id}/{counter}.png"
-
-            counter += 1
+    async def _upload_to_cdn(self, gen: GeneratedImages, *, folder: str):
+        img_id = uuid.uuid4()
 
-    async def create_image(
-        self, prompt: str, n: int, *, size: Size, user: str = None
-    ) -> GeneratedImages:
+        for counter, image in enumerate(gen.images, start=1):
+            await self._upload_image(image, f"{folder}/{img_id}/{counter}")
+
+    async def _generate_image(
+        self,
+        gen: GeneratedImages,
+        prompt: str,
+        size: str,
+        user: str | None,
+        approval: typing.Awaitable[bool] | None,
+        name: str,
+    ) -> GeneratedImage:
+        # dall-e-3 does not support n > 1
+        response = await self.client.images.generate(
+            prompt=prompt,
+            n=1,
+            size=size,
+            user=user,
+            model="dall-e-3",
+            response_format=self.RESPONSE_FORMAT,
+        )
+        image = GeneratedImage(gen, response.data[0].model_dump())
+
+        await wait_for_approval(approval)
+        await self._upload_image(image, name)
+
+        return image
+
+    async def iter_create_image(
+        self,
+        prompt: str,
+        n: int,
+        *,
+        size: Size,
+        user: str = None,
+        approval: typing.Awaitable[bool] = None,
+    ) -> typing.AsyncIterator[GeneratedImage]:
+        """
+        Like `create_image`, but yields each image as soon as it's uploaded. Failed images are skipped.
+        """
         if 1 > n or n > 10:
             raise ValueError("n must be between 1 and 10")
 
         s = size.get_size()
+        img_id = uuid.uuid4()
 
-        response = await asyncio.gather(
-            *[
-                self.client.images.generate(
-                    prompt=prompt, n=1, size=s, user=user, model="dall-e-3"
-                )
-                for _ in range(n)
-            ]
-        )  # dall-e-3 does not support n > 1
+        gen = GeneratedImages(self, {"created": int(time.time()), "data": []})
 
-        gen = GeneratedImages(self, response)
-        await self._upload_to_cdn(gen)
+        async for image in iter_completed(
+            self._generate_image(
+                gen, prompt, s, user, approval, f"dalle3-results/{img_id}/{i}"
+            )
+            for i in range(1, n + 1)
+        ):
+            yield gen.add(image)
 
-        return gen
+    async def create_image(
+        self,
+        prompt: str,
+        n: int,
+        *,
+        size: Size,
+        user: str = None,
+        approval: typing.Awaitable[bool] = None,
+    ) -> GeneratedImages:
+        images = [
+            image
+            async for image in self.iter_create_image(
+                prompt, n, size=size, user=user, approval=approval
+            )
+        ]
+
+        return images[0]._gen
 
     async def create_image_variations(
         self, image: str | bytes | io.BytesIO, n: int, *, size: Size, user: str = None
@@ -111,21 +176,61 @@ class ImageUtilities:
         elif isinstance(image, io.BytesIO):
             image = image.getvalue()
 
+        image = await self.preprocessor.prepare_for_dalle(image, size.value)
+
         response = await self.client.images.create_variation(
-            image=image, n=n, size=s, user=user
+            image=image, n=n, size=s, user=user, response_format=self.RESPONSE_FORMAT
         )
 
-        gen = GeneratedImages(self, response)
-        await self._upload_to_cdn(gen)
+        gen = GeneratedImages(self, response.model_dump())
+        await self._upload_to_cdn(gen, folder="dalle2-results")
 
         return gen
 
+    async def _get_cached_analysis(self, key: str) -> dict | None:
+        if (js := self.ANALYZE_CACHE.get(key)) is not None:
+            return js
+
+        if self.pool is None:
+            return None
+
+        row = await self.pool.fetchrow(
+            "SELECT result FROM image_analysis WHERE hash=$1 AND ttl > now()", key
+        )
+
+        if row is None:
+            return None
+
+        js = self.ANALYZE_CACHE[key] = json.loads(row["result"])
+
+        return js
+
+    async def _cache_analysis(self, key: str, js: dict):
+        self.ANALYZE_CACHE[key] = js
+
+        if self.pool is None:
+            return
+
+        q = "INSERT INTO image_analysis (hash, result, ttl) VALUES ($1, $2::json, $3) ON CONFLICT (hash) DO UPDATE SET result = $2::json, ttl = $3;"
+
+        await self.pool.execute(
+            q,
+            key,
+            json.dumps(js),
+            datetime.datetime.now(datetime.timezone.utc) + self.ANALYZE_TTL,
+        )
+
     async def analyze(self, image: str | bytes | io.BytesIO) -> AnalyzeResult:
         if isinstance(image, str):
             image = open(image, "rb").read()
         elif isinstance(image, io.BytesIO):
             image = image.getvalue()
 
+        key = hashlib.sha256(image).hexdigest()
+
+        if (js := await self._get_cached_analysis(key)) is not None:
+            return AnalyzeResult(js)
+
         data = aiohttp.FormData()
         data.add_field("image", image)
 
@@ -134,4 +239,7 @@ class ImageUtilities:
         ) as resp:
             js = await resp.json()
 
-        return AnalyzeResult(js)
+        result = AnalyzeResult(js)  # Raises on error responses, so those aren't cached.
+        await self._cache_analysis(key, js)
+
+        return result
@@ -2,12 +2,19 @@ import asyncio
 import io
 import json
 import random
+import re
+import time
 import typing
 import uuid
 
 import aiohttp
 import yarl
 
+from core.cdn import CDN
+from core.moderation import wait_for_approval
+
+from ..stream import iter_completed
+
 
 class _Latin1BodyPartReader(aiohttp.multipart.BodyPartReader):
     async def text(self) -> str:
@@ -23,6 +30,46 @@ class _Latin1MultipartReader(aiohttp.multipart.MultipartReader):
         return part_reader
 
 
+class FireflyStyles:
+    """
+    The Firefly style catalogue, with one compiled pattern that finds every style title in a prompt.
+    """
+
+    def __init__(self, data: dict):
+        self.data = data
+        self.styles: dict[str, dict] = {s["title"].lower(): s for s in data["styles"]}
+
+        # Longest first so e.g. "Digital Art" wins over "Art".
+        titles = sorted(self.styles, key=len, reverse=True)
+        self.pattern = (
+            re.compile(
+                r"(?<!\w)(?:" + "|".join(map(re.escape, titles)) + r")(?!\w)",
+                re.IGNORECASE,
+            )
+            if titles
+            else None
+        )
+
+    def get(self, title: str) -> dict | None:
+        return self.styles.get(title.lower())
+
+    def extract(self, prompt: str) -> tuple[str, list[dict]]:
+        """
+        Strip the style titles out of `prompt` in one pass, returns the new prompt and the styles.
+        """
+        if self.pattern is None:
+            return prompt, []
+
+        found = {}
+
+        def strip(m: re.Match) -> str:
+            title = m.group().lower()
+            found.setdefault(title, self.styles[title])
+            return ""
+
+        return self.pattern.sub(strip, prompt), list(found.values())
+
+
 FIREFLY_SIZES = typing.Literal[
     "Portrait",
     "Landscape",
@@ -38,6 +85,7 @@ FIREFLY_SIZES = typing.Literal[
 class Firefly:
     URL = yarl.URL("https://firefly.adobe.io/spl")
     ASSET_URL = yarl.URL("https://clio-assets.adobe.com/clio-playground")
+    CHUNK_SIZE = 64 * 1024
     SIZES = {  # (Aspect Ratio, Width, Height)
         "Portrait": ((3, 4), 1024, 1408),
         "Landscape": ((4, 3), 1408, 1024),
@@ -49,8 +97,15 @@ class Firefly:
         # "Panoramic": ((32, 9), 3840, 1080),
         # "Panoramic Portrait": ((9, 32), 1080, 3840),
     }
-
-    def __init__(self, token: str, *, session: aiohttp.ClientSession, cdn: tuple):
+    # Shared style catalogue, re-fetched every `STYLES_TTL` seconds.
+    STYLES: FireflyStyles | None = None
+    STYLES_FETCHED_AT = 0.0
+    STYLES_TTL = 60 * 60
+    _STYLES_LOCK = asyncio.Lock()
+
+    def __init__(
+        self, token: str, *, session: aiohttp.ClientSession, cdn: CDN | tuple
+    ):
         self.token = token
         self.session = session
 
@@ -63,7 +118,8 @@ class Firefly:
             "DNT": "1",
         }
 
-        self.s3, self.bucket, self.host = cdn
+        self.cdn = cdn if isinstance(cdn, CDN) else CDN(*cdn)
+        self.s3, self.bucket, self.host = self.cdn.s3, self.cdn.bucket, self.cdn.host
 
     @staticmethod
     def generate_settings(
@@ -125,6 +181,40 @@ class Firefly:
         async with self.session.get(url) as resp:
             return await resp.json()
 
+    @classmethod
+    def _styles_fresh(cls) -> bool:
+        return (
+            cls.STYLES is not None
+            and time.monotonic() - cls.STYLES_FETCHED_AT < cls.STYLES_TTL
+        )
+
+    async def get_styles(self) -> FireflyStyles:
+        """
+        The cached style catalogue, the matcher is only rebuilt when the catalogue changes.
+        """
+        if self._styles_fresh():
+            return Firefly.STYLES
+
+        async with Firefly._STYLES_LOCK:
+            # Someone else refreshed it while we were waiting.
+            if self._styles_fresh():
+                return Firefly.STYLES
+
+            try:
+                data = await self.get_image_styles()
+            except Exception:
+                if Firefly.STYLES is None:
+                    raise
+
+                data = Firefly.STYLES.data  # Keep the one we have, try again next time.
+
+            if Firefly.STYLES is None or Firefly.STYLES.data != data:
+                Firefly.STYLES = FireflyStyles(data)
+
+            Firefly.STYLES_FETCHED_AT = time.monotonic()
+
+        return Firefly.STYLES
+
     async def text_to_image(
         self,
         prompt: str,
@@ -135,43 +225,77 @@ class Firefly:
         styles: list[str] = [],
         fix_face: bool = True,
         seed: int = None,
+        approval: typing.Awaitable[bool] = None,
     ) -> list[str]:
+        return [
+            url
+            async for url in self.iter_text_to_image(
+                prompt,
+                amount,
+                width=width,
+                height=height,
+                styles=styles,
+                fix_face=fix_face,
+                seed=seed,
+                approval=approval,
+            )
+        ]
+
+    async def iter_text_to_image(
+        self,
+        prompt: str,
+        amount: int,
+        *,
+        width: int = 1024,
+        height: int = 1024,
+        styles: list[str] = [],
+        fix_face: bool = True,
+        seed: int = None,
+        approval: typing.Awaitable[bool] = None,
+    ) -> typing.AsyncIterator[str]:
+        """
+        Like `text_to_image`, but yields each CDN URL as soon as it's uploaded. Failed images are skipped.
+        """
         styles = styles or []
-        _styles = await self.get_image_styles()
-        style_prompt = []
-        anchor_prompt = []
-        leftover_styles = styles.copy()
-        for s in _styles["styles"]:
-            for style in styles:
-                if style.lower() == s["title"].lower():
-                    if s["style_prompt"]:
-                        style_prompt.append(s["style_prompt"])
-                    if s["anchor_prompt"]:
-                        anchor_prompt.append(s["anchor_prompt"])
-                    leftover_styles.remove(style)
+        catalogue = await self.get_styles()
+
+        chosen = {}
+        leftover_styles = []
+
+        for style in styles:
+            if (s := catalogue.get(style)) is None:
+                leftover_styles.append(style)
+            else:
+                chosen[s["title"]] = s
 
         if leftover_styles:
             raise ValueError(f"Invalid styles: {', '.join(leftover_styles)}")
 
-        for i in _styles["styles"]:
-            if i["title"].lower() in prompt:
-                prompt = prompt.replace(i["title"].lower(), "")
-                if i["style_prompt"]:
-                    style_prompt.append(i["style_prompt"])
-                if i["anchor_prompt"]:
-                    anchor_prompt.append(i["anchor_prompt"])
+        prompt, found = catalogue.extract(prompt)
+
+        for s in found:
+            chosen.setdefault(s["title"], s)
 
-        style_prompt = ", ".join(style_prompt)
-        anchor_prompt = ", ".join(anchor_prompt)
+        style_prompt = ", ".join(
+            s["style_prompt"] for s in chosen.values() if s["style_prompt"]
+        )
+        anchor_prompt = ", ".join(
+            s["anchor_prompt"] for s in chosen.values() if s["anchor_prompt"]
+        )
 
         settings = self.generate_settings(
             prompt, width, height, style_prompt, anchor_prompt, fix_face, seed
         )
 
-        images = await asyncio.gather(
-            *[self._text_to_image_inner_task(settings) for _ in range(amount)]
-        )
-        return [self.post_to_cdn(i, folder="firefly/text-to-image") for i in images]
+        async def task():
+            image = await self._text_to_image_inner_task(settings)
+
+            await wait_for_approval(approval)
+
+            return await self.post_to_cdn(image, folder="firefly/text-to-image")
+
+        async for url in iter_completed(task() for _ in range(amount)):
+            yield url
 
     async def _text_to_image_inner_task(self, settings: dict):
         h = self.headers.copy()
@@ -192,24 +316,30 @@ class Firefly:
 
             async with self.session.post(self.URL, headers=h, data=writer) as resp:
                 reader = _Latin1MultipartReader(resp.headers, resp.content)
-                image = None
-                while True:
-                    part = await reader.next()
-                    if part.headers[aiohttp.hdrs.CONTENT_TYPE] == "image/jpeg":
-                        image = await part.read(decode=False)
-                    if image:
-                        break
-
-                return io.BytesIO(image)
-
-    def post_to_cdn(self, image: io.BytesIO, *, folder: str) -> str:
-        key = folder + "/" + str(uuid.uuid4()) + ".jpg"
-        url = f"{self.host}/{key}"
-
-        self.s3.upload_fileobj(
-            image,
-            Bucket=self.bucket,
-            Key=key,
-        )
+                other_parts = []
+
+                while (part := await reader.next()) is not None:
+                    if part.headers.get(aiohttp.hdrs.CONTENT_TYPE) != "image/jpeg":
+                        other_parts.append(await part.text())  # Small JSON parts (status)
+                        continue
+
+                    # Stream the image straight into the buffer that gets uploaded.
+                    image = io.BytesIO()
+
+                    while chunk := await part.read_chunk(self.CHUNK_SIZE):
+                        image.write(chunk)
+
+                    # Drain whatever is left (just the status part) so the connection goes back to
+                    # the pool instead of being closed.
+                    await reader.release()
+
+                    image.seek(0)
+
+                    return image
+
+                raise ValueError(
+                    f"Firefly did not return an image: {' '.join(other_parts) or resp.status}"
+                )
 
-        return url
+    async def post_to_cdn(self, image: io.BytesIO, *, folder: str) -> str:
+        return await self.cdn.upload_image(image, folder + "/" + str(uuid.uuid4()))
@@ -1,13 +1,29 @@
+import asyncio
+import base64
+import collections
 import datetime
 import io
+import itertools
 import typing
 
+from core.fetch import Fetcher
+
 
 class GeneratedImage:
     def __init__(self, gen: "GeneratedImages", data: dict):
         self._gen = gen
+        self._data = data
+
+        # `b64_json` responses are held in memory until they're uploaded and get a URL.
+        self.url: str | None = data.get("url")
+        self.buffer: bytes | None = (
+            base64.b64decode(data["b64_json"]) if data.get("b64_json") else None
+        )
 
-        self.url: str = data["url"]
+    def _set_uploaded(self, url: str):
+        self.url = self._data["url"] = url
+        self.buffer = None
+        self._data.pop("b64_json", None)
 
     def __eq__(self, other):
         return isinstance(other, GeneratedImage) and self.url == other.url
@@ -15,8 +31,15 @@ class GeneratedImage:
     async def read(self, *, io_type=None) -> bytes | typing.Any:
         io_type = io_type or bytes
 
-        async with self._gen._client.session.get(self.url) as resp:
-            return io_type(await resp.read())
+        if self.buffer is not None:
+            return io_type(self.buffer)
+
+        return io_type(await Fetcher(self._gen._client.session).read(self.url))
+
+    @staticmethod
+    def _write_file(path, data: bytes) -> int:
+        with open(path, "wb") as f:
+            return f.write(data)
 
     async def save(self, fp, *, seek=True):
         img = await self.read()
@@ -29,11 +52,13 @@ class GeneratedImage:
 
             return written
         else:
-            with open(fp, "wb") as f:
-                return f.write(img)
+            # Disk I/O goes to a thread so it doesn't block the event loop.
+            return await asyncio.to_thread(self._write_file, fp, img)
 
 
 class GeneratedImages:
+    MAX_CONCURRENT_READS = 4
+
     def __init__(self, client, data):
         self._client = client
         self._data = data
@@ -50,15 +75,47 @@ class GeneratedImages:
     def __eq__(self, other):
         return isinstance(other, GeneratedImages) and self._data == other._data
 
-    def get_urls(self):
-        return [img.url for img in self.images]
-
-    async def read_all(self, *, io_type=None) -> list[bytes | typing.Any]:
-        io_type = io_type or bytes
+    def add(self, image: GeneratedImage) -> GeneratedImage:
+        """
+        Add an image that finished after the others were created.
+        """
+        self._images.append(image._data)
+        self.images.append(image)
 
-        imgs = []
+        return image
 
-        for img in self.images:
-            imgs.append(await img.read(io_type=io_type))
+    def get_urls(self):
+        return [img.url for img in self.images]
 
-        return imgs
+    async def iter_bytes(
+        self, *, io_type=None, concurrency: int = None
+    ) -> typing.AsyncIterator[bytes | typing.Any]:
+        """
+        Yield the images in order, downloading at most `concurrency` of them ahead at a time.
+        """
+        concurrency = concurrency or self.MAX_CONCURRENT_READS
+        images = iter(self.images)
+        pending = collections.deque(
+            asyncio.ensure_future(img.read(io_type=io_type))
+            for img in itertools.islice(images, concurrency)
+        )
+
+        try:
+            while pending:
+                data = await pending.popleft()
+
+                if (img := next(images, None)) is not None:
+                    pending.append(asyncio.ensure_future(img.read(io_type=io_type)))
+
+                yield data
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def read_all(
+        self, *, io_type=None, concurrency: int = None
+    ) -> list[bytes | typing.Any]:
+        return [
+            img
+            async for img in self.iter_bytes(io_type=io_type, concurrency=concurrency)
+        ]
@@ -1,10 +1,11 @@
 import asyncio
-import io
-import math
+import dataclasses
 import typing
 
 import aiohttp
 
+from core.cdn import CDN
+from core.moderation import wait_for_approval
 from core.replicate import Replicate, ReplicateResult
 
 WH = typing.Literal[128, 256, 512, 768, 1024]
@@ -12,13 +13,15 @@ WH = typing.Literal[128, 256, 512, 768, 1024]
 
 class Midjourney:
     MODEL_VERSION = "prompthero/openjourney:latest"
+    MAX_OUTPUTS = 4  # `num_outputs` limit of the model per prediction.
+    MAX_CONCURRENT_PREDICTIONS = 4
 
     def __init__(
-        self, api_token: str, *, session: aiohttp.ClientSession, cdn: tuple
+        self, api_token: str, *, session: aiohttp.ClientSession, cdn: CDN | tuple
     ) -> None:
         self.replicate = Replicate(api_token, session=session)
         self.session = session
-        self.cdn, self.bucket, self.host = cdn
+        self.cdn = cdn if isinstance(cdn, CDN) else CDN(*cdn)
 
     def check(self, n: int, width: WH, height: WH):
         if width not in [128, 256, 512, 768, 1024] or height not in [
@@ -41,82 +44,67 @@ class Midjourney:
         if n > 10:
             raise ValueError("amount of pictures to be generated must be <=10.")
 
+    def plan(self, n: int, width: WH, height: WH) -> list[int]:
+        """
+        Split `n` images into the fewest predictions allowed, returns the `num_outputs` of each.
+        """
+        # memory limits, 1024x768 can only do 1 image per prediction.
+        per_prediction = 1 if width + height == (1024 + 768) else self.MAX_OUTPUTS
+
+        plan = [per_prediction] * (n // per_prediction)
+
+        if n % per_prediction:
+            plan.append(n % per_prediction)
+
+        return plan
+
     async def generate(
-        self, prompt: str, n: int, *, width: WH, height: WH, publish: bool = True
+        self,
+        prompt: str,
+        n: int,
+        *,
+        width: WH,
+        height: WH,
+        publish: bool = True,
+        approval: typing.Awaitable[bool] = None,
     ) -> ReplicateResult:
         self.check(n, width, height)
 
         prompt = "mdjrny-v4 style " + prompt
 
-        result = None
+        plan = self.plan(n, width, height)
+        inputs = [
+            {"prompt": prompt, "width": width, "height": height, "num_outputs": amount}
+            for amount in plan
+        ]
 
-        if width + height == (1024 + 768) and n > 1:
-            # memory limits, hacky workaround:
-            # amount = 1, do manually until n is achieved
-            base = await self.replicate.run(
-                self.MODEL_VERSION, wait=True, prompt=prompt, width=width, height=height
-            )
-            imgs = []
-            for i in range(n - 1):
-                imgs.append(
-                    await self.replicate.run(
-                        self.MODEL_VERSION,
-                        wait=True,
-                        prompt=prompt,
-                        width=width,
-                        height=height,
-                    )
-                )
+        predictions: list[ReplicateResult | None] = [None] * len(plan)
+        async for i, prediction in self.replicate.run_many(
+            self.MODEL_VERSION, inputs, concurrency=self.MAX_CONCURRENT_PREDICTIONS
+        ):
+            predictions[i] = prediction
 
-            base.output.extend([i.output[0] for i in imgs])
+        succeeded = [p for p in predictions if p.status == "succeeded" and p.output]
 
-            result = base
-        elif n == 1:
-            result = await self.replicate.run(
-                self.MODEL_VERSION, wait=True, prompt=prompt, width=width, height=height
-            )
-        else:
-            base = await self.replicate.run(
-                self.MODEL_VERSION, wait=True, prompt=prompt, width=width, height=height
+        if not succeeded:
+            raise ValueError(
+                f"Midjourney generation failed: {predictions[0].error or predictions[0].status}"
             )
-            _imgs = []
-            _tasks = []
-            for i in range(math.ceil((n - 1) / 4)):
-                _tasks.append(
-                    self.replicate.run(
-                        self.MODEL_VERSION,
-                        wait=True,
-                        prompt=prompt,
-                        width=width,
-                        height=height,
-                        num_outputs=4,
-                    )
-                )
-
-            _imgs = await asyncio.gather(*_tasks)
 
-            imgs = []
-            for i in _imgs:
-                imgs.extend(i.output)
+        result = dataclasses.replace(
+            succeeded[0], output=[url for p in succeeded for url in p.output][:n]
+        )
 
-            base.output.extend(imgs)
-            result = base
+        await wait_for_approval(approval)
 
         if publish:
-            for i, furl in enumerate(result.output):
-                key = f"midjourney-images/{result.id}/{i}.png"
-
-                async with self.session.get(furl) as resp:
-                    data = await resp.read()
-
-                self.cdn.upload_fileobj(
-                    io.BytesIO(data),
-                    Bucket=self.bucket,
-                    Key=key,
-                )
-
-                url = f"{self.host}/{key}"
-
-                result.output[i] = url
+            result.output[:] = await asyncio.gather(
+                *[
+                    self.cdn.mirror_image(
+                        self.session, furl, f"midjourney-images/{result.id}/{i}"
+                    )
+                    for i, furl in enumerate(result.output)
+                ]
+            )
 
         return result
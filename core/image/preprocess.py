@@ -0,0 +1,136 @@
+import asyncio
+import io
+import multiprocessing
+import typing
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image as PILImage
+from PIL import ImageOps
+
+DALLE_SIZES = (1024, 512, 256)
+DALLE_MAX_BYTES = 4 * 1024 * 1024
+
+WEBP_QUALITY = 80
+WEBP_MAX_SIDE = 16383  # Format limit
+THUMBNAIL_SIZE = 512
+THUMBNAIL_QUALITY = 70
+
+
+# These run inside the process pool, so they have to stay top-level (picklable) functions.
+
+
+def prepare_for_dalle(data: bytes, size: int = 1024) -> bytes:
+    """
+    Make an image acceptable for DALL-E variations: a square RGBA PNG of `size` pixels, under 4 MB.
+    """
+    img = PILImage.open(io.BytesIO(data))
+    img = ImageOps.exif_transpose(img).convert("RGBA")
+
+    # Center crop to a square
+    width, height = img.size
+    side = min(width, height)
+    left = (width - side) // 2
+    top = (height - side) // 2
+    img = img.crop((left, top, left + side, top + side))
+
+    for s in DALLE_SIZES:
+        if s > size:
+            continue
+
+        buf = io.BytesIO()
+        img.resize((s, s), PILImage.LANCZOS).save(buf, format="PNG", optimize=True)
+
+        if buf.tell() <= DALLE_MAX_BYTES:
+            return buf.getvalue()
+
+    raise ValueError("Image is too large even after resizing.")
+
+
+def _open_for_webp(data: bytes) -> PILImage.Image:
+    img = PILImage.open(io.BytesIO(data))
+    img = ImageOps.exif_transpose(img)
+
+    if max(img.size) > WEBP_MAX_SIDE:
+        raise ValueError("Image is too large for WebP.")
+
+    has_alpha = img.mode in ("RGBA", "LA", "PA") or (
+        img.mode == "P" and "transparency" in img.info
+    )
+
+    return img.convert("RGBA" if has_alpha else "RGB")
+
+
+def _save_webp(img: PILImage.Image, quality: int) -> bytes:
+    buf = io.BytesIO()
+    img.save(buf, format="WEBP", quality=quality, method=4)
+
+    return buf.getvalue()
+
+
+def encode_webp(data: bytes, quality: int = WEBP_QUALITY) -> bytes:
+    return _save_webp(_open_for_webp(data), quality)
+
+
+def encode_for_cdn(
+    data: bytes,
+    quality: int = WEBP_QUALITY,
+    thumbnail_size: int = THUMBNAIL_SIZE,
+) -> tuple[bytes, bytes]:
+    """
+    Re-encode an image as WebP, returns the full size image and a `thumbnail_size` thumbnail.
+    """
+    img = _open_for_webp(data)
+    full = _save_webp(img, quality)
+
+    img.thumbnail((thumbnail_size, thumbnail_size), PILImage.LANCZOS)
+
+    return full, _save_webp(img, THUMBNAIL_QUALITY)
+
+
+class ImagePreprocessor:
+    """
+    Runs CPU-heavy PIL work in a process pool so it doesn't hold the GIL on the bot's event loop.
+
+    The pool is shared by every instance (the image and maps cogs, CDN uploads) and started on first
+    use. It lives until the bot closes.
+    """
+
+    MAX_WORKERS: int | None = None
+    START_METHOD = (
+        "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    )
+    _EXECUTOR: ProcessPoolExecutor | None = None
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if ImagePreprocessor._EXECUTOR is None:
+            # Forking a process with running threads (boto3 uploads, aiohttp's resolver) can
+            # deadlock the child, start the workers from a clean server process instead.
+            ImagePreprocessor._EXECUTOR = ProcessPoolExecutor(
+                max_workers=self.MAX_WORKERS,
+                mp_context=multiprocessing.get_context(self.START_METHOD),
+            )
+
+        return ImagePreprocessor._EXECUTOR
+
+    async def run(self, func: typing.Callable, *args) -> typing.Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    async def prepare_for_dalle(self, data: bytes, size: int = 1024) -> bytes:
+        return await self.run(prepare_for_dalle, data, size)
+
+    async def encode_webp(self, data: bytes) -> bytes:
+        return await self.run(encode_webp, data)
+
+    async def encode_for_cdn(self, data: bytes) -> tuple[bytes, bytes]:
+        return await self.run(encode_for_cdn, data)
+
+    @classmethod
+    def shutdown(cls) -> None:
+        """
+        Shut down the shared pool, only call this when the bot closes since every cog is using it.
+        """
+        if ImagePreprocessor._EXECUTOR is not None:
+            ImagePreprocessor._EXECUTOR.shutdown(wait=False, cancel_futures=True)
+            ImagePreprocessor._EXECUTOR = None
@@ -0,0 +1,39 @@
+import asyncio
+import typing
+
+from core.moderation import PromptRejected
+
+T = typing.TypeVar("T")
+
+
+async def iter_completed(
+    aws: typing.Iterable[typing.Awaitable[T]],
+) -> typing.AsyncIterator[T]:
+    """
+    Yield the results of `aws` as they finish.
+
+    Failed ones are skipped unless every one of them fails, then the last error is raised. A rejected
+    prompt is raised right away. Whatever is still running is cancelled when the iterator is closed.
+    """
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    error = None
+    succeeded = False
+
+    try:
+        for fut in asyncio.as_completed(tasks):
+            try:
+                result = await fut
+            except PromptRejected:
+                raise
+            except Exception as e:
+                error = e
+                continue
+
+            succeeded = True
+            yield result
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    if not succeeded and error is not None:
+        raise error
@@ -1,2 +1,3 @@
+from .catalogue import *
 from .dataclass import *
 from .style import *
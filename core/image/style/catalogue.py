@@ -0,0 +1,100 @@
+import asyncio
+import bisect
+import typing
+
+from .dataclass import Style
+
+
+class StyleCatalogue:
+    """
+    In-memory catalogue of the available styles, loaded once and refreshed in the background.
+
+    Lookups by name, by model type and by name prefix (for autocomplete) never hit the network.
+    """
+
+    REFRESH_INTERVAL = 60 * 60
+
+    def __init__(self) -> None:
+        self.styles: list[Style] = []
+        self.by_name: dict[str, Style] = {}
+        self.by_model_type: dict[str, list[Style]] = {}
+        self._prefixes: list[tuple[str, Style]] = []  # Sorted by lowercased name.
+
+        self._task: asyncio.Task | None = None
+
+    @property
+    def loaded(self) -> bool:
+        return bool(self.styles)
+
+    def load(self, styles: list[Style]) -> None:
+        by_name = {}
+        by_model_type = {}
+
+        for style in styles:
+            by_name[style.name.lower()] = style
+            by_model_type.setdefault(style.model_type, []).append(style)
+
+        self.styles = styles
+        self.by_name = by_name
+        self.by_model_type = by_model_type
+        self._prefixes = sorted(
+            ((style.name.lower(), style) for style in styles), key=lambda x: x[0]
+        )
+
+    def get(self, name: str) -> Style | None:
+        return self.by_name.get(name.lower())
+
+    def get_model_type(self, model_type: str) -> list[Style]:
+        return self.by_model_type.get(model_type, [])
+
+    def search(self, query: str, limit: int = 25) -> list[Style]:
+        """
+        Styles starting with `query` first, then the ones containing it.
+        """
+        query = query.lower()
+
+        if not query:
+            return self.styles[:limit]
+
+        i = bisect.bisect_left(self._prefixes, query, key=lambda x: x[0])
+        results = []
+
+        while (
+            i < len(self._prefixes)
+            and self._prefixes[i][0].startswith(query)
+            and len(results) < limit
+        ):
+            results.append(self._prefixes[i][1])
+            i += 1
+
+        if len(results) < limit:
+            for name, style in self._prefixes:
+                if query in name and not name.startswith(query):
+                    results.append(style)
+
+                    if len(results) >= limit:
+                        break
+
+        return results
+
+    def start(self, fetch: typing.Callable[[], typing.Awaitable[list[Style]]]) -> None:
+        """
+        Refresh the catalogue every `REFRESH_INTERVAL` seconds.
+        """
+        self.stop()
+
+        async def refresh():
+            while True:
+                await asyncio.sleep(self.REFRESH_INTERVAL)
+
+                try:
+                    self.load(await fetch())
+                except Exception:
+                    pass  # Keep the current catalogue, try again next time.
+
+        self._task = asyncio.create_task(refresh())
+
+    def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
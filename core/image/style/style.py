@@ -1,16 +1,23 @@
 import asyncio
-import io
+import typing
 
 import aiohttp
 
+from core.cdn import CDN
+from core.moderation import wait_for_approval
+
+from ..stream import iter_completed
+from .catalogue import StyleCatalogue
 from .dataclass import *
 
 
 class GenerateStyleArt:
     URL = "https://api.luan.tools/api"
+    CATALOGUE = StyleCatalogue()  # Shared, so styles are only fetched once.
 
-    def __init__(self, s3, session: aiohttp.ClientSession, key: str):
-        self.s3, self.bucket, self.host = s3
+    def __init__(self, cdn: CDN | tuple, session: aiohttp.ClientSession, key: str):
+        self.cdn = cdn if isinstance(cdn, CDN) else CDN(*cdn)
+        self.s3, self.bucket, self.host = self.cdn.s3, self.cdn.bucket, self.cdn.host
 
         self.session = session
 
@@ -22,33 +29,35 @@ class GenerateStyleArt:
             "Content-Type": "application/json",
         }
 
-    async def get_styles(self, *, raw: bool = False) -> list[Style] | dict[str, Style]:
+    async def fetch_styles(self) -> list[Style]:
         async with self.session.get(
             self.URL + "/styles/", headers=self._get_headers()
         ) as resp:
             js = await resp.json()
 
-        if raw:
-            return [Style(**style) for style in js]
+        return [Style(**style) for style in js]
 
-        d = {}
+    async def refresh_styles(self) -> StyleCatalogue:
+        self.CATALOGUE.load(await self.fetch_styles())
 
-        for style in js:
-            if style["model_type"] not in d:
-                d[style["model_type"]] = []
+        return self.CATALOGUE
 
-            d[style["model_type"]] = Style(**style)
+    async def get_styles(
+        self, *, raw: bool = False
+    ) -> list[Style] | dict[str, list[Style]]:
+        if not self.CATALOGUE.loaded:
+            await self.refresh_styles()
 
-        return d
+        if raw:
+            return self.CATALOGUE.styles
 
-    async def get_style_from_name(self, name: str) -> Style | None:
-        styles = await self.get_styles(raw=True)
+        return self.CATALOGUE.by_model_type
 
-        for style in styles:
-            if style.name == name:
-                return style
+    async def get_style_from_name(self, name: str) -> Style | None:
+        if not self.CATALOGUE.loaded:
+            await self.refresh_styles()
 
-        return None
+        return self.CATALOGUE.get(name)
 
     async def create_task(self):
         data = {"use_target_image": False}
@@ -98,24 +107,57 @@ class GenerateStyleArt:
 
         return js
 
-    async def _upload_to_cdn(self, images: list[GeneratedImage]):
-        for i, image in enumerate(images):
-            original_url = image.result
-            img_id = image.id
+    async def _upload_to_cdn(self, image: GeneratedImage, i: int) -> GeneratedImage:
+        image.result = await self.cdn.mirror_image(
+            self.session, image.result, f"art-results/{image.id}/{i}"
+        )
 
-            async with self.session.get(original_url) as resp:
-                data = await resp.read()
+        return image
 
-            # Upload to S3
-            self.s3.upload_fileobj(
-                io.BytesIO(data),
-                Bucket=self.bucket,
-                Key=f"art-results/{image.id}/{i+1}.png",
-            )
+    async def _generate_one(
+        self,
+        prompt: str,
+        style: Style,
+        i: int,
+        *,
+        height: int | None,
+        width: int | None,
+        approval: typing.Awaitable[bool] | None,
+    ) -> GeneratedImage:
+        task = await self.create_task()
+        await self.update_task(task["id"], prompt, style, height=height, width=width)
+
+        while task["state"] not in ["completed", "failed"]:
+            task = await self.get_task(task["id"])
+            await asyncio.sleep(1)
 
-            image.result = f"{self.host}/art-results/{img_id}/{i+1}.png"
+        if task["state"] == "failed":
+            raise RuntimeError(f"Style generation task {task['id']} failed.")
 
-        return images
+        await wait_for_approval(approval)
+
+        return await self._upload_to_cdn(GeneratedImage(**task), i)
+
+    async def iter_generate(
+        self,
+        prompt: str,
+        style: Style,
+        n: int = 1,
+        *,
+        height: int = None,
+        width: int = None,
+        approval: typing.Awaitable[bool] = None,
+    ) -> typing.AsyncIterator[GeneratedImage]:
+        """
+        Like `generate`, but yields each image as soon as it's uploaded. Failed images are skipped.
+        """
+        async for image in iter_completed(
+            self._generate_one(
+                prompt, style, i, height=height, width=width, approval=approval
+            )
+            for i in range(1, n + 1)
+        ):
+            yield image
 
     async def generate(
         self,
@@ -125,23 +167,11 @@ class GenerateStyleArt:
         *,
         height: int = None,
         width: int = None,
+        approval: typing.Awaitable[bool] = None,
     ) -> list[GeneratedImage]:
-        images = []
-
-        async def func(self):
-            task = await self.create_task()
-            await self.update_task(
-                task["id"], prompt, style, height=height, width=width
+        return [
+            image
+            async for image in self.iter_generate(
+                prompt, style, n, height=height, width=width, approval=approval
             )
-
-            while task["state"] not in ["completed", "failed"]:
-                task = await self.get_task(task["id"])
-                await asyncio.sleep(1)
-
-            images.append(GeneratedImage(**task))
-
-        await asyncio.gather(*[func(self) for _ in range(n)])
-
-        images = await self._upload_to_cdn(images)
-
-        return images
+        ]
@@ -1,33 +1,142 @@
+import base64
+import datetime
+import hashlib
+import re
 from io import BytesIO
 from typing import Any
 
 import aiohttp
+import asyncpg
+import cachetools
 
+from core.cdn import CDN
+from core.fetch import Fetcher, sniff
 from core.replicate import Replicate
 
 
 class Upscaling:
     MODEL_VERSION = "proguy914629bot/real-esrgan:latest"
+    # CDN URLs of upscaled images by (SHA-256 of the image, scale), backed by the `upscales` table.
+    CACHE = cachetools.LRUCache(maxsize=1024)
+    CACHE_TTL = datetime.timedelta(days=30)
 
-    def __init__(self, api_token: str, session: aiohttp.ClientSession) -> None:
+    def __init__(
+        self,
+        api_token: str,
+        session: aiohttp.ClientSession,
+        *,
+        cdn: CDN = None,
+        pool: asyncpg.Pool = None,
+    ) -> None:
         self.api_token = api_token
         self.session = session
+        self.cdn = cdn
+        self.pool = pool
 
         self.replicate = Replicate(api_token, session=session)
+        self.fetcher = Fetcher(session)
 
-    async def upscale(self, image: str | bytes, *, scale: int = 2) -> bytes:
+    @staticmethod
+    def _to_input(image: str | bytes) -> str:
+        # Replicate downloads public URLs itself, anything else is sent inline as a data URI.
+        if isinstance(image, str):
+            if re.match(r"^https?://", image):
+                return image
+
+            image = open(image, "rb").read()
+
+        content_type = sniff(image) or "application/octet-stream"
+
+        return f"data:{content_type};base64,{base64.b64encode(image).decode()}"
+
+    async def _predict(self, image: str | bytes, scale: int) -> str:
         if 1 > scale or scale > 10:
             raise ValueError("Scale must be between 1 and 10")
 
         prediction = await self.replicate.run(
             self.MODEL_VERSION,
-            img=image,
+            img=self._to_input(image),
             version="General - RealESRGANplus",
             scale=scale,
             wait=True,
         )
-        async with self.session.get(prediction.output) as resp:
+
+        if prediction.status != "succeeded" or not prediction.output:
+            raise ValueError(
+                f"Upscaling failed: {prediction.error or prediction.status}"
+            )
+
+        return prediction.output
+
+    async def upscale(self, image: str | bytes, *, scale: int = 2) -> bytes:
+        output = await self._predict(image, scale)
+
+        async with self.session.get(output) as resp:
             return await resp.read()
 
+    async def _get_cached(self, key: tuple[str, int]) -> str | None:
+        if (url := self.CACHE.get(key)) is not None:
+            return url
+
+        if self.pool is None:
+            return None
+
+        url = await self.pool.fetchval(
+            "SELECT url FROM upscales WHERE hash=$1 AND scale=$2 AND ttl > now()", *key
+        )
+
+        if url is not None:
+            self.CACHE[key] = url
+
+        return url
+
+    async def _set_cached(self, key: tuple[str, int], url: str):
+        self.CACHE[key] = url
+
+        if self.pool is None:
+            return
+
+        q = "INSERT INTO upscales (hash, scale, url, ttl) VALUES ($1, $2, $3, $4) ON CONFLICT (hash, scale) DO UPDATE SET url = $3, ttl = $4;"
+
+        await self.pool.execute(
+            q, *key, url, datetime.datetime.now(datetime.timezone.utc) + self.CACHE_TTL
+        )
+
+    async def upscale_to_cdn(self, image: str | bytes, *, scale: int = 2) -> str:
+        """
+        Upscale `image` and upload the result to the CDN, returns its URL.
+
+        Results are cached by the image's content hash and the scale, so upscaling the same image
+        again returns the existing CDN object.
+        """
+        if self.cdn is None:
+            raise RuntimeError("Upscaling was created without a CDN.")
+
+        data = (
+            await self.fetcher.read(image, types=("image/",))
+            if isinstance(image, str) and re.match(r"^https?://", image)
+            else image
+        )
+
+        if isinstance(data, str):
+            data = open(data, "rb").read()
+
+        digest = hashlib.sha256(data).hexdigest()
+        key = (digest, scale)
+
+        if (url := await self._get_cached(key)) is not None:
+            return url
+
+        # Public URLs are passed through as-is instead of re-sending the bytes.
+        output = await self._predict(image if isinstance(image, str) else data, scale)
+
+        url = await self.cdn.mirror_image(
+            self.session, output, f"upscaling/{digest}-{scale}x"
+        )
+
+        await self._set_cached(key, url)
+
+        return url
+
     async def __call__(self, image: str | bytes, *, scale: int = 2) -> BytesIO:
         return BytesIO(await self.upscale(image, scale=scale))
@@ -0,0 +1,225 @@
+import asyncio
+import collections
+import hashlib
+import json
+import re
+import statistics
+import time
+import typing
+from dataclasses import dataclass, field
+
+import aiohttp
+import cachetools
+
+T = typing.TypeVar("T")
+
+# Obvious rejections that don't need a round trip to Perspective.
+BLOCKLIST = (
+    "nsfw",
+    "porn",
+    "porno",
+    "pornographic",
+    "hentai",
+    "nude",
+    "nudes",
+    "naked",
+    "genitals",
+    "gore",
+)
+
+
+@dataclass(frozen=True)
+class ModerationDecision:
+    allowed: bool
+    source: str  # "blocklist", "cache" or "perspective"
+    latency: float
+    scores: dict = field(default_factory=dict)
+
+
+class Moderation:
+    """
+    Prompt moderation through Perspective, with a local blocklist in front and a verdict cache.
+    """
+
+    URL = "https://commentanalyzer.googleapis.com/v1alpha1/comments:analyze"
+    ATTRIBUTES = (
+        "TOXICITY",
+        "SEVERE_TOXICITY",
+        "IDENTITY_ATTACK",
+        "INSULT",
+        "PROFANITY",
+        "THREAT",
+        "SEXUALLY_EXPLICIT",
+        "FLIRTATION",
+    )
+    SCORE_THRESHOLD = 0.75
+    # Verdicts keyed by the hash of the normalised prompt, shared so re-rolls are free.
+    CACHE = cachetools.TTLCache(maxsize=4096, ttl=60 * 60)
+
+    def __init__(
+        self,
+        key: str,
+        *,
+        session: aiohttp.ClientSession,
+        blocklist: tuple[str, ...] | list[str] = BLOCKLIST,
+    ):
+        self.key = key
+        self.session = session
+
+        words = sorted({w.lower() for w in blocklist}, key=len, reverse=True)
+        self.blocklist = (
+            re.compile(r"\b(?:" + "|".join(map(re.escape, words)) + r")\b")
+            if words
+            else None
+        )
+
+        self.latencies: collections.deque[tuple[str, float]] = collections.deque(
+            maxlen=1000
+        )
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return " ".join(text.casefold().split())
+
+    @staticmethod
+    def hash(normalized: str) -> str:
+        return hashlib.sha256(normalized.encode()).hexdigest()
+
+    def prefilter(self, normalized: str) -> bool:
+        """
+        Returns `False` if the text is rejected by the local blocklist.
+        """
+        return not (self.blocklist and self.blocklist.search(normalized))
+
+    async def analyze(self, text: str) -> dict:
+        return (await self._analyze(text))[1]
+
+    async def _analyze(self, text: str) -> tuple[int, dict]:
+        body = {
+            "comment": {
+                "text": text,
+            },
+            "requestedAttributes": {
+                attr: {"scoreThreshold": self.SCORE_THRESHOLD}
+                for attr in self.ATTRIBUTES
+            },
+            "languages": ["en"],
+        }
+
+        params = {
+            "key": self.key,
+        }
+
+        async with self.session.post(
+            self.URL, data=json.dumps(body), params=params
+        ) as resp:
+            return resp.status, await resp.json(content_type=None)
+
+    def _record(self, decision: ModerationDecision) -> ModerationDecision:
+        self.latencies.append((decision.source, decision.latency))
+        return decision
+
+    def precheck(self, text: str) -> ModerationDecision | None:
+        """
+        The decision if it can be made without a network call (blocklist or cache), `None` if
+        Perspective has to be asked.
+        """
+        start = time.perf_counter()
+
+        normalized = self.normalize(text)
+
+        if not self.prefilter(normalized):
+            return self._record(
+                ModerationDecision(False, "blocklist", time.perf_counter() - start)
+            )
+
+        if (allowed := self.CACHE.get(self.hash(normalized))) is not None:
+            return self._record(
+                ModerationDecision(allowed, "cache", time.perf_counter() - start)
+            )
+
+        return None
+
+    async def check(self, text: str) -> ModerationDecision:
+        if (decision := self.precheck(text)) is not None:
+            return decision
+
+        start = time.perf_counter()
+        key = self.hash(self.normalize(text))
+
+        status, js = await self._analyze(text)
+        scores = js.get("attributeScores", {})
+        allowed = not scores
+
+        # A failed call (quota, unsupported language...) has no scores, that's not a verdict to keep.
+        if status == 200 and "error" not in js:
+            self.CACHE[key] = allowed
+
+        return self._record(
+            ModerationDecision(
+                allowed, "perspective", time.perf_counter() - start, scores
+            )
+        )
+
+    def stats(self) -> dict[str, dict[str, int | float]]:
+        """
+        Count, mean and p95 latency (in ms) of recent decisions per source.
+        """
+        by_source = collections.defaultdict(list)
+
+        for source, latency in self.latencies:
+            by_source[source].append(latency * 1000)
+
+        return {
+            source: {
+                "count": len(latencies),
+                "mean": statistics.fmean(latencies),
+                "p95": (
+                    statistics.quantiles(latencies, n=20)[-1]
+                    if len(latencies) > 1
+                    else latencies[0]
+                ),
+            }
+            for source, latencies in by_source.items()
+        }
+
+
+class PromptRejected(Exception):
+    pass
+
+
+async def wait_for_approval(approval: typing.Awaitable[bool] | None) -> None:
+    """
+    Called by generators before uploading anything, raises `PromptRejected` if moderation failed.
+    """
+    if approval is not None and not await asyncio.shield(approval):
+        raise PromptRejected()
+
+
+async def speculate(
+    check: typing.Awaitable[bool],
+    generate: typing.Callable[[asyncio.Future], typing.Awaitable[T]],
+) -> T:
+    """
+    Run moderation and generation at the same time.
+
+    `generate` gets the moderation future as `approval` and must pass it to `wait_for_approval`
+    before uploading its outputs. If moderation rejects the prompt the generation is cancelled and
+    `PromptRejected` is raised.
+    """
+    approval = asyncio.ensure_future(check)
+    generation = asyncio.ensure_future(generate(approval))
+
+    try:
+        allowed = await asyncio.shield(approval)
+    except BaseException:
+        generation.cancel()
+        raise
+
+    if not allowed:
+        generation.cancel()
+        # Don't warn about a generation that already failed, we're discarding it anyway.
+        generation.add_done_callback(lambda t: t.cancelled() or t.exception())
+        raise PromptRejected()
+
+    return await generation
@@ -1,14 +1,24 @@
 import asyncio
+import hashlib
+import tempfile
 import time
 import typing
 
 import aiohttp
+import cachetools
+
+from core.fetch import FetchError, FileTooLarge
 
 FAST_BEST = typing.Literal["fast", "best"]
 
 
 class GenrePrediction:
     URL = "https://api.yodabot.xyz/v/{}/music/predict-genre"  # Use Yoda API
+    MAX_BYTES = 25 * 1024 * 1024
+    CHUNK_SIZE = 64 * 1024
+    SPOOL_MEMORY = 1024 * 1024  # Downloads bigger than this are spooled to disk.
+    # Results by (SHA-256 of the audio, mode).
+    CACHE = cachetools.TTLCache(maxsize=512, ttl=24 * 60 * 60)
 
     def __init__(self, *, session: aiohttp.ClientSession = None, api_version="1"):
         self.session: aiohttp.ClientSession = session or aiohttp.ClientSession()
@@ -20,15 +30,53 @@ class GenrePrediction:
     ) -> tuple[dict[str, int | float], float, float, int | float]:
         return await self.run(file, mode=mode)
 
-    async def read_url(self, url) -> bytes:
+    async def iter_url(self, url: str) -> typing.AsyncIterator[bytes]:
+        """
+        Stream the file at `url` in chunks, up to `MAX_BYTES`.
+        """
         async with self.session.get(url) as resp:
-            return await resp.read()
+            if resp.status >= 400:
+                raise FetchError(f"Could not download file ({resp.status}).")
+
+            size = 0
+
+            async for chunk in resp.content.iter_chunked(self.CHUNK_SIZE):
+                size += len(chunk)
+
+                if size > self.MAX_BYTES:
+                    raise FileTooLarge(self.MAX_BYTES)
+
+                yield chunk
 
-    async def call_api(self, file: bytes, *, mode: FAST_BEST = "fast") -> dict:
+    async def spool(self, url: str) -> tuple[str, typing.BinaryIO]:
+        """
+        Download `url` into a spooled temporary file while hashing it, returns the SHA-256 and the
+        file (rewound). The file is only in memory up to `SPOOL_MEMORY`, close it when done.
+        """
+        h = hashlib.sha256()
+        spool = tempfile.SpooledTemporaryFile(max_size=self.SPOOL_MEMORY)
+
+        try:
+            async for chunk in self.iter_url(url):
+                h.update(chunk)
+                spool.write(chunk)
+        except BaseException:
+            spool.close()
+            raise
+
+        spool.seek(0)
+
+        return h.hexdigest(), spool
+
+    async def call_api(
+        self, file: bytes | typing.BinaryIO, *, mode: FAST_BEST = "fast"
+    ) -> dict:
         params = {"mode": mode}
 
         data = aiohttp.FormData()
-        data.add_field("file", file)
+        data.add_field(
+            "file", file, filename="file", content_type="application/octet-stream"
+        )
 
         async with self.session.post(self.url, data=data, params=params) as resp:
             d = await resp.json()
@@ -49,7 +97,7 @@ class GenrePrediction:
         return data
 
     async def run_fast(
-        self, file: bytes
+        self, file: bytes | typing.BinaryIO
     ) -> tuple[dict[str, int | float], float, float, int | float]:
         mode: FAST_BEST = "fast"
 
@@ -60,7 +108,7 @@ class GenrePrediction:
         return res, start, end, end - start
 
     async def run_best(
-        self, file: bytes
+        self, file: bytes | typing.BinaryIO
     ) -> tuple[dict[str, int | float], float, float, int | float]:
         mode: FAST_BEST = "best"
 
@@ -76,14 +124,44 @@ class GenrePrediction:
 
         return res, start, end, end - start
 
+    @staticmethod
+    def successful(res) -> bool:
+        """
+        Whether `res` is an actual prediction (genre -> confidence) and not an error payload.
+        """
+        return (
+            isinstance(res, dict)
+            and bool(res)
+            and all(isinstance(v, (int, float)) for v in res.values())
+        )
+
     async def run(
         self, file: bytes | str, *, mode: FAST_BEST = "fast"
     ) -> tuple[dict[str, int | float], float, float, int | float]:
-        if isinstance(file, str):
-            file = await self.read_url(file)
-
-        match mode:
-            case "fast":
-                return await self.run_fast(file)
-            case "best":
-                return await self.run_best(file)
+        # URLs are downloaded once, into a spool that's hashed on the way and uploaded on a miss.
+        if isinstance(file, bytes):
+            digest, spool = hashlib.sha256(file).hexdigest(), None
+        else:
+            digest, spool = await self.spool(file)
+            file = spool
+
+        try:
+            key = (digest, mode)
+
+            if (res := self.CACHE.get(key)) is not None:
+                now = time.perf_counter()
+                return res, now, now, 0
+
+            match mode:
+                case "fast":
+                    result = await self.run_fast(file)
+                case "best":
+                    result = await self.run_best(file)
+        finally:
+            if spool is not None:
+                spool.close()
+
+        if self.successful(result[0]):
+            self.CACHE[key] = result[0]
+
+        return result
@@ -1,14 +1,21 @@
 import asyncio
-import io
-from dataclasses import dataclass, field
+import datetime
+import itertools
+import json
+import time
+import typing
+from dataclasses import asdict, dataclass, field
 from urllib.parse import quote
 
 import aiohttp
+import asyncpg
+import cachetools
 import spotipy2.types
 from discord.app_commands import Choice
 from spotipy2 import Spotify
 from spotipy2.auth import ClientCredentialsFlow
 
+from core.cdn import CDN
 from core.music.spotify.spotify_scraper import SpotifyScraper
 
 
@@ -18,6 +25,7 @@ class LyricResult:
     artist: str = None
     lyrics: str = None
     images: dict[str, str] = field(default_factory=dict)
+    id: str = None  # Spotify track ID, if known
 
     @staticmethod
     def empty():
@@ -35,6 +43,9 @@ class LyricAutocompleteSuggestions:
 
 
 class LyricLocalAPI:
+    # How long to wait for the artwork after the lyrics are ready before using Spotify's URLs.
+    ARTWORK_TIMEOUT = 1.5
+
     def __init__(
         self,
         session: aiohttp.ClientSession,
@@ -45,7 +56,8 @@ class LyricLocalAPI:
         sp_key: str,
     ):
         self.session = session
-        self.cdn, self.bucket, self.host = cdn
+        self.cdn = cdn if isinstance(cdn, CDN) else CDN(*cdn)
+        self.bucket, self.host = self.cdn.bucket, self.cdn.host
         self.client_id = client_id
         self.client_secret = client_secret
         self.sp_dc = sp_dc
@@ -64,32 +76,50 @@ class LyricLocalAPI:
             track = track[0]
             track = await self.get_track_info(track["id"])
 
-        lyrics = await self._client.get_lyrics(track.id)
-        if lyrics is None:
-            return LyricResult.empty()
-
         if raw:
-            return lyrics
+            lyrics = await self._client.get_lyrics(track.id)
+            return lyrics if lyrics is not None else LyricResult.empty()
 
-        lyrics = "\n".join([x["words"] for x in lyrics["lyrics"]["lines"]])
         title = track.name
         artist = ", ".join([a.name for a in track.artists])
-        images = {
-            "track": await self._post_to_cdn(
-                track.album.images[0]["url"],
-                f'lyrics/{title.replace(" ", "_")}-{" ".join([a.name.replace(" ", "_") for a in track.artists])}/track.jpg',
-            ),
-            "background": await self._post_to_cdn(
-                (
-                    track.artists[0].images[0]["url"]
-                    if track.artists[0].images
-                    else track.album.images[0]["url"]
-                ),
-                f'lyrics/{title.replace(" ", "_")}-{" ".join([a.name.replace(" ", "_") for a in track.artists])}/background.jpg',
+        originals = {
+            "track": track.album.images[0]["url"],
+            "background": (
+                track.artists[0].images[0]["url"]
+                if track.artists[0].images
+                else track.album.images[0]["url"]
             ),
         }
 
-        return {"title": title, "artist": artist, "lyrics": lyrics, "images": images}
+        # Mirror the artwork while the lyrics are being fetched instead of after.
+        artwork = asyncio.ensure_future(self._mirror_artwork(track, originals))
+        artwork.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+        lyrics = await self._client.get_lyrics(track.id)
+        if lyrics is None:
+            artwork.cancel()
+            return LyricResult.empty()
+
+        lyrics = "\n".join([x["words"] for x in lyrics["lyrics"]["lines"]])
+
+        try:
+            images = await asyncio.wait_for(
+                asyncio.shield(artwork), self.ARTWORK_TIMEOUT
+            )
+        except Exception:
+            # Spotify's own URLs work too, the upload carries on in the background.
+            images = originals
+
+        return {
+            "title": title,
+            "artist": artist,
+            "lyrics": lyrics,
+            "images": images,
+            "id": track.id,
+        }
+
+    async def close(self):
+        await self._client.close()
 
     async def search_autocomplete(self, query: str, limit: int = 10) -> list[dict]:
         x = await self.spotify.search(query, types=[spotipy2.types.Track], limit=limit)
@@ -103,23 +133,116 @@ class LyricLocalAPI:
         x = await self.spotify.get_track(track_id)
         return x
 
-    async def _post_to_cdn(self, url: str, key: str):
-        async with self.session.get(url) as resp:
-            data = await resp.read()
+    async def _mirror_artwork(self, track, originals: dict[str, str]) -> dict[str, str]:
+        folder = f'lyrics/{track.name.replace(" ", "_")}-{" ".join([a.name.replace(" ", "_") for a in track.artists])}'
 
-        self.cdn.upload_fileobj(
-            io.BytesIO(data),
-            Bucket=self.bucket,
-            Key=key,
+        track_url, background_url = await asyncio.gather(
+            self._post_to_cdn(originals["track"], f"{folder}/track.jpg"),
+            self._post_to_cdn(originals["background"], f"{folder}/background.jpg"),
         )
 
+        return {"track": track_url, "background": background_url}
+
+    async def _post_to_cdn(self, url: str, key: str):
+        await self.cdn.mirror(self.session, url, key, content_type="image/jpeg")
+
         url = f"{self.host}/{quote(key, safe='')}"
         return url
 
 
+class LyricAutocomplete:
+    """
+    Per-user debounced, cached slash command autocomplete for lyric queries.
+
+    A keystroke only hits the APIs if the user stops typing for `DEBOUNCE` seconds. Results are
+    cached per query. If the APIs are too slow (or the user kept typing), the results of a cached
+    shorter query that still match are returned before Discord's 3 second deadline instead.
+    """
+
+    DEBOUNCE = 0.35
+    DEADLINE = 2.5
+    CACHE = cachetools.TTLCache(maxsize=4096, ttl=10 * 60)
+
+    def __init__(
+        self,
+        fetch: typing.Callable[
+            [str, int], typing.Awaitable[list[LyricAutocompleteSuggestions]]
+        ],
+        *,
+        amount: int = 10,
+    ):
+        self.fetch = fetch
+        self.amount = amount
+
+        self._counter = itertools.count()
+        self._latest: dict[int, int] = {}  # user ID -> their latest request
+
+    @staticmethod
+    def _matches(query: str, suggestion: LyricAutocompleteSuggestions) -> bool:
+        text = str(suggestion).casefold()
+        return all(word in text for word in query.split())
+
+    def _from_prefix(self, query: str) -> list[LyricAutocompleteSuggestions] | None:
+        """
+        Results of the longest cached prefix of `query` that still match it.
+
+        Only a fallback: Spotify ranks by relevance (artists, albums, fuzzy matches), so a longer
+        query can find tracks the prefix search never returned.
+        """
+        for i in range(len(query) - 1, 0, -1):
+            if (cached := self.CACHE.get(query[:i])) is not None:
+                return [s for s in cached if self._matches(query, s)]
+
+        return None
+
+    async def _fetch(self, query: str) -> list[LyricAutocompleteSuggestions]:
+        suggestions = await self.fetch(query, self.amount)
+        self.CACHE[query] = suggestions
+
+        return suggestions
+
+    async def __call__(
+        self, user_id: int, query: str
+    ) -> list[LyricAutocompleteSuggestions]:
+        start = time.monotonic()
+        query = Lyrics.normalize(query)
+
+        if not query:
+            return []
+
+        if (cached := self.CACHE.get(query)) is not None:
+            return cached
+
+        stale = self._from_prefix(query)
+
+        request = self._latest[user_id] = next(self._counter)
+
+        try:
+            await asyncio.sleep(self.DEBOUNCE)
+
+            if self._latest.get(user_id) != request:
+                return stale or []  # They kept typing, Discord will drop this response anyway.
+
+            # Shielded so the result still gets cached for the next keystroke if we time out.
+            task = asyncio.ensure_future(self._fetch(query))
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+            return await asyncio.wait_for(
+                asyncio.shield(task), self.DEADLINE - (time.monotonic() - start)
+            )
+        except Exception:
+            return stale or []
+        finally:
+            if self._latest.get(user_id) == request:
+                del self._latest[user_id]
+
+
 class Lyrics:
     local = LyricLocalAPI
-    CACHE = {}
+    # Results keyed by "q:<normalised query>" and "id:<Spotify track ID>", backed by the `lyrics` table.
+    CACHE = cachetools.TTLCache(maxsize=1024, ttl=24 * 60 * 60)
+    CACHE_SWEEP_INTERVAL = 10 * 60
+    PERSISTENT_CACHE_TTL = datetime.timedelta(days=7)
     URL = "https://api.yodabot.xyz/v/{}/lyrics"  # Use Yoda API
 
     def __init__(
@@ -128,6 +251,7 @@ class Lyrics:
         *,
         loop: asyncio.AbstractEventLoop = None,
         session: aiohttp.ClientSession = None,
+        pool: asyncpg.Pool = None,
         api_version="latest",
     ):
         self.session: aiohttp.ClientSession = session or aiohttp.ClientSession()
@@ -136,28 +260,90 @@ class Lyrics:
 
         self.loop = loop or asyncio.get_event_loop()
 
-        self.CACHE_TTL_TASKS = []
+        self.pool = pool
 
         self._local = local
+        self._sweeper: asyncio.Task | None = None
+
+        self.autocompleter = LyricAutocomplete(self.autocomplete)
 
     async def __call__(
         self, query: str, *, cache: bool = True, get_from_cache: bool | None = None
     ):
         return self.search(query, cache=cache, get_from_cache=get_from_cache)
 
-    def set_cache(self, key, value, ttl=24 * 60 * 60):
-        self.CACHE[key] = value
+    async def close(self):
+        if self._sweeper:
+            self._sweeper.cancel()
+            self._sweeper = None
+
+        if self._local:
+            await self._local.close()
+
+    async def _sweep(self):
+        # TTLCache only drops expired entries when it's written to, this keeps memory flat when idle.
+        while True:
+            await asyncio.sleep(self.CACHE_SWEEP_INTERVAL)
+            self.CACHE.expire()
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        return " ".join(query.casefold().split())
+
+    @classmethod
+    def cache_keys(cls, query: str, res: LyricResult = None) -> list[str]:
+        keys = [f"q:{cls.normalize(query)}"]
+
+        if res is not None and res.id:
+            keys.append(f"id:{res.id}")
+        elif res is None:
+            keys.append(f"id:{query.strip()}")  # The query might be a track ID (autocomplete)
+
+        return keys
 
-        async def task():
-            while True:
-                await asyncio.sleep(ttl)
-                self.CACHE.pop(key)
+    async def set_cache(self, query: str, res: LyricResult):
+        if self._sweeper is None:
+            self._sweeper = self.loop.create_task(self._sweep())
 
-        if ttl is not None:
-            self.CACHE_TTL_TASKS.append(self.loop.create_task(task()))
+        keys = self.cache_keys(query, res)
 
-    def get_cache(self, key):
-        return self.CACHE.get(key)
+        for key in keys:
+            self.CACHE[key] = res
+
+        if self.pool is None:
+            return
+
+        ttl = datetime.datetime.now(datetime.timezone.utc) + self.PERSISTENT_CACHE_TTL
+        data = json.dumps(asdict(res))
+
+        q = "INSERT INTO lyrics (key, result, ttl) VALUES ($1, $2::json, $3) ON CONFLICT (key) DO UPDATE SET result = $2::json, ttl = $3;"
+
+        await self.pool.executemany(q, [(key, data, ttl) for key in keys])
+
+    async def get_cache(self, query: str) -> LyricResult | None:
+        keys = self.cache_keys(query)
+
+        for key in keys:
+            if (res := self.CACHE.get(key)) is not None:
+                return res
+
+        if self.pool is None:
+            return None
+
+        row = await self.pool.fetchrow(
+            "SELECT result FROM lyrics WHERE key = ANY($1::text[]) AND ttl > now() LIMIT 1",
+            keys,
+        )
+
+        if row is None:
+            return None
+
+        res = LyricResult(**json.loads(row["result"]))
+
+        for key in self.cache_keys(query, res):
+            self.CACHE[key] = res
+
+        return res
 
     async def call_api(self, query_or_id: str) -> dict:
         try:
@@ -180,9 +366,7 @@ class Lyrics:
     async def search(
         self, query: str, *, cache: bool = True, get_from_cache: bool | None = None
     ):
-        q_lower = query.lower()
-
-        if (cached := self.get_cache(q_lower)) and get_from_cache is not False:
+        if get_from_cache is not False and (cached := await self.get_cache(query)):
             return cached
 
         if get_from_cache is True:
@@ -190,13 +374,15 @@ class Lyrics:
 
         data = await self.call_api(query)
 
-        res = LyricResult(**data)
+        res = LyricResult(
+            **{k: v for k, v in data.items() if k in LyricResult.__dataclass_fields__}
+        )
 
         if not res.lyrics:
             return LyricResult.empty()
 
         if cache:
-            self.set_cache(q_lower, res)
+            await self.set_cache(query, res)
 
         return res
 
@@ -240,3 +426,12 @@ class Lyrics:
             ]
 
         return suggestions
+
+    async def slash_autocomplete(self, user_id: int, query: str) -> list[Choice]:
+        """
+        Debounced and cached `autocomplete` for slash commands, see `LyricAutocomplete`.
+        """
+        return [
+            Choice(name=str(suggestion), value=suggestion.id or str(suggestion))
+            for suggestion in await self.autocompleter(user_id, query)
+        ]
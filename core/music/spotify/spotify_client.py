@@ -1,4 +1,5 @@
 import asyncio
+import time
 
 import aiohttp
 
@@ -7,6 +8,33 @@ from core.music.spotify.config import *
 # from exceptions import SpotifyClientException
 
 
+class SpotifyTokens:
+    """
+    The web player access token and client token with their expiry times.
+    """
+
+    REFRESH_MARGIN = 60  # Refresh this many seconds before a token expires.
+
+    def __init__(self):
+        self.access_token = ""
+        self.access_expires_at = 0.0
+        self.client_token = ""
+        self.client_expires_at = 0.0
+        self.client_id = ""
+
+        self.lock = asyncio.Lock()
+
+    @property
+    def valid(self) -> bool:
+        deadline = time.time() + self.REFRESH_MARGIN
+
+        return (
+            bool(self.access_token and self.client_token)
+            and self.access_expires_at > deadline
+            and self.client_expires_at > deadline
+        )
+
+
 class SpotifyClient:
     # _proxy = PROXY
     _client_token = ""
@@ -17,6 +45,8 @@ class SpotifyClient:
 
     user_data = None
 
+    ACCESS_TOKEN_URL = "https://open.spotify.com/get_access_token"
+
     def __init__(self, sp_dc=None, sp_key=None, session: aiohttp.ClientSession = None):
         self.dc = sp_dc
         self.key = sp_key
@@ -33,15 +63,64 @@ class SpotifyClient:
         }
 
         self.session = session
+        self.tokens = SpotifyTokens()
+        self._token_session: aiohttp.ClientSession | None = None
+
+    @property
+    def token_session(self) -> aiohttp.ClientSession:
+        """
+        Session for the access token exchange.
+
+        It shares the connection pool of `session`, but has its own cookie jar so the sp_dc/sp_key
+        cookies (and whatever Spotify sets back) stay scoped to this client.
+        """
+        if self._token_session is None or self._token_session.closed:
+            self._token_session = aiohttp.ClientSession(
+                connector=self.session.connector,
+                connector_owner=False,
+                cookie_jar=aiohttp.CookieJar(),
+            )
+
+        return self._token_session
+
+    async def close(self):
+        if self._token_session is not None:
+            await self._token_session.close()  # Doesn't close the shared connector.
 
     async def get_tokens(self, sp_dc=None, sp_key=None):
-        self._access_token, self._client_id = await self.get_access_token(
-            sp_dc=sp_dc, sp_key=sp_key
+        tokens = self.tokens
+
+        (
+            tokens.access_token,
+            tokens.client_id,
+            tokens.access_expires_at,
+        ) = await self.get_access_token(sp_dc=sp_dc, sp_key=sp_key)
+        tokens.client_token, tokens.client_expires_at = await self.get_client_token(
+            tokens.client_id
         )
-        self._client_token = await self.get_client_token(self._client_id)
 
-    async def refresh_tokens(self):
-        await self.get_tokens(self.dc, self.key)
+        self._access_token = tokens.access_token
+        self._client_id = tokens.client_id
+        self._client_token = tokens.client_token
+
+    async def refresh_tokens(self, *, stale: str = None):
+        """
+        Refresh the tokens, concurrent calls share one refresh.
+
+        `stale` is the access token a request was rejected with, nothing is refreshed if it has
+        already been replaced by a valid one.
+        """
+        async with self.tokens.lock:
+            if self.tokens.valid and (
+                stale is None or self.tokens.access_token != stale
+            ):
+                return
+
+            await self.get_tokens(self.dc, self.key)
+
+    async def ensure_tokens(self):
+        if not self.tokens.valid:
+            await self.refresh_tokens()
 
     async def get_client_token(self, client_id: str):
         headers = self.__HEADERS
@@ -87,7 +166,11 @@ class SpotifyClient:
                 # raise SpotifyClientException('Failed to parse client token response as json!', ex)
                 raise ex
 
-        return rj["granted_token"]["token"]
+        granted = rj["granted_token"]
+
+        return granted["token"], time.time() + granted.get(
+            "refresh_after_seconds", granted.get("expires_after_seconds", 0)
+        )
 
     async def get_access_token(self, keys=None, sp_dc=None, sp_key=None):
         # session.proxies = self._proxy
@@ -106,26 +189,31 @@ class SpotifyClient:
         # except Exception as ex:
         #     raise SpotifyClientException('An error occured when generating an access token!', ex)
 
-        # Seems to not work for some reason...
-        # async with self.session.get(
-        #     "https://open.spotify.com/get_access_token", verify_ssl=self._verify_ssl, cookies=cookie, headers=headers
-        # ) as response:
-        #     try:
-        #         rj = await response.json()
-        #     except Exception as ex:
-        #         # raise SpotifyClientException('An error occured when generating an access token!', ex)
-        #         raise ex
-
-        command = f'curl --cookie "sp_dc={sp_dc}" --cookie "sp_key={sp_key}" https://open.spotify.com/get_access_token'
-        proc = await asyncio.create_subprocess_shell(
-            command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
-        )
-        stdout, stderr = await proc.communicate()
-        rj = json.loads(stdout.decode("utf-8"))
+        # Only the cookies, like curl does. The web player headers (Origin, Sec-Fetch-*, ...) get the
+        # request rejected.
+        cookies = {}
+        if sp_dc is not None:
+            cookies["sp_dc"] = sp_dc
+        if sp_key is not None:
+            cookies["sp_key"] = sp_key
+
+        async with self.token_session.get(
+            self.ACCESS_TOKEN_URL,
+            cookies=cookies,
+            headers={"Accept": "application/json"},
+            verify_ssl=self._verify_ssl,
+        ) as response:
+            rj = await response.json(content_type=None)
 
         self.is_anonymous = rj["isAnonymous"]
-        return rj["accessToken"], (
-            rj["clientId"] if rj["clientId"].lower() != "unknown" else self._client_id
+        return (
+            rj["accessToken"],
+            (
+                rj["clientId"]
+                if rj["clientId"].lower() != "unknown"
+                else self._client_id
+            ),
+            rj["accessTokenExpirationTimestampMs"] / 1000,
         )
 
     async def get(self, url: str) -> dict:
@@ -140,19 +228,26 @@ class SpotifyClient:
         #     response = session.get(url, verify=self._verify_ssl)
         #     return response
 
-        await self.refresh_tokens()
+        await self.ensure_tokens()
 
-        headers = self.__HEADERS.copy()
-        headers.update(
-            {
-                "Client-Token": self._client_token,
-                "Authorization": f"Bearer {self._access_token}",
-            }
-        )
-        async with self.session.get(
-            url, verify_ssl=self._verify_ssl, headers=headers
-        ) as resp:
-            return await resp.json()
+        for retry in (True, False):
+            access_token = self.tokens.access_token
+
+            headers = self.__HEADERS.copy()
+            headers.update(
+                {
+                    "Client-Token": self.tokens.client_token,
+                    "Authorization": f"Bearer {access_token}",
+                }
+            )
+            async with self.session.get(
+                url, verify_ssl=self._verify_ssl, headers=headers
+            ) as resp:
+                if resp.status != 401 or not retry:
+                    return await resp.json()
+
+            # Revoked or expired early, refresh once and try again.
+            await self.refresh_tokens(stale=access_token)
 
     # def post(self, url: str, payload=None) -> Response:
     #     with requests.session() as session:
@@ -15,6 +15,9 @@ class SpotifyScraper:
     async def get(self, url: str) -> dict:
         return await self._client.get(url)
 
+    async def close(self):
+        await self._client.close()
+
     # def post(self, url: str, payload=None) -> Response:
     #     return self._client.post(url, payload=payload)
 
@@ -5,6 +5,7 @@ import re
 import aiohttp
 
 from core.auth import get_gcp_token
+from core.fetch import Fetcher
 
 
 class OCR:
@@ -12,10 +13,10 @@ class OCR:
 
     def __init__(self, *, session: aiohttp.ClientSession):
         self.session = session
+        self.fetcher = Fetcher(session)
 
     async def read_url(self, url: str) -> bytes:
-        async with self.session.get(url) as resp:
-            return await resp.read()
+        return await self.fetcher.read(url, types=("image/",))
 
     async def request(self, data: str | bytes, *, raw=False) -> str | dict:
         if isinstance(data, str):
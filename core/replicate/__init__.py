@@ -1,2 +1,3 @@
 from .client import Replicate
 from .dataclass import ReplicateResult
+from .webhook import ReplicateWebhook
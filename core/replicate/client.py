@@ -1,23 +1,35 @@
 import asyncio
 import json
 import re
+import typing
 from typing import Any
 
 import aiohttp
 import yarl
 
 from .dataclass import ReplicateResult, create_dataclass
+from .tracker import PredictionTracker
+from .versions import VersionResolver
+from .webhook import TERMINAL_STATUSES, ReplicateWebhook
 
 
 # Keeping it simple cause this is only used to make predictions only, only sole purpose is to make it asynchronous.
 class Replicate:
     BASE_URL = yarl.URL("https://api.replicate.com/v1/")
+    WEBHOOK: ReplicateWebhook | None = None  # Set on startup when the webhook receiver is enabled.
+    WEBHOOK_POLL_INTERVAL = 10  # Fallback polling interval when waiting on a webhook, in seconds.
+    VERSIONS = VersionResolver()  # Shared across instances, resolves `:latest` versions.
 
     def __init__(
-        self, api_token: str, *, session: aiohttp.ClientSession = None
+        self,
+        api_token: str,
+        *,
+        session: aiohttp.ClientSession = None,
+        webhook: ReplicateWebhook = None,
     ) -> None:
         self.api_token = api_token
         self.session = session or aiohttp.ClientSession()
+        self.webhook = webhook or Replicate.WEBHOOK
 
     def _get_headers(self):
         return {"Authorization": f"Token {self.api_token}"}
@@ -34,11 +46,11 @@ class Replicate:
 
         return data["results"][0]["id"]
 
-    async def run(
-        self, model_version: str, *, wait: bool = True, **inputs
+    async def create(
+        self, model_version: str, *, with_webhook: bool = False, **inputs
     ) -> ReplicateResult:
         """
-        Run a prediction in Replicate asynchronously.
+        Create a prediction in Replicate without waiting for it to finish.
         """
         # Similar code with the Official Replicate Python SDK
         # Split model_version into owner, name, version in format owner/name:version
@@ -55,9 +67,16 @@ class Replicate:
         version = m.group("version")
 
         if version == "latest":
-            version = await self.get_latest_version(owner, model)
+            version = await self.VERSIONS.resolve(
+                owner, model, self.get_latest_version
+            )
 
         data = {"version": version, "input": inputs}
+
+        if with_webhook and self.webhook:
+            data["webhook"] = self.webhook.url
+            data["webhook_events_filter"] = ["completed"]
+
         h = self._get_headers()
         h["Content-Type"] = "application/json"
 
@@ -65,25 +84,114 @@ class Replicate:
             self.BASE_URL / "predictions", data=json.dumps(data), headers=h
         ) as resp:
             js = await resp.json()
-            prediction = create_dataclass(js, resp.status)
+            return create_dataclass(js, resp.status)
 
-        if wait:
-            done, pending = await asyncio.wait(
-                [self._create_wait_task(model, version, prediction)],
-                return_when=asyncio.FIRST_COMPLETED,
-            )
+    async def run(
+        self, model_version: str, *, wait: bool = True, **inputs
+    ) -> ReplicateResult:
+        """
+        Run a prediction in Replicate asynchronously.
+        """
+        prediction = await self.create(model_version, with_webhook=wait, **inputs)
 
-            if done:
-                prediction = done.pop().result()
+        if wait and prediction.status not in TERMINAL_STATUSES:
+            if self.webhook:
+                prediction = await self._wait_for_webhook(prediction)
+            else:
+                prediction = await self._create_wait_task(
+                    prediction.model, prediction.version, prediction
+                )
 
         return prediction
 
-    async def get(self, prediction: ReplicateResult) -> ReplicateResult:
+    async def run_many(
+        self,
+        model_version: str,
+        inputs: list[dict[str, Any]],
+        *,
+        concurrency: int = None,
+    ) -> typing.AsyncIterator[tuple[int, ReplicateResult]]:
+        """
+        Run several predictions at once, yielding `(index, prediction)` as each one finishes.
+
+        At most `concurrency` predictions are running at a time, the rest are submitted as soon as
+        a slot frees up. The status of every prediction is checked together through
+        `PredictionTracker` instead of polling each one separately. Predictions still running when
+        the iterator is closed or cancelled are cancelled on Replicate.
+        """
+        concurrency = concurrency or len(inputs)
+        queue = list(enumerate(inputs))
+        index = {}
+        tracker = PredictionTracker(self)
+
+        async def submit(amount: int):
+            batch, queue[:] = queue[:amount], queue[amount:]
+
+            creating = asyncio.gather(
+                *[self.create(model_version, with_webhook=True, **i) for _, i in batch]
+            )
+
+            try:
+                predictions = await asyncio.shield(creating)
+            except asyncio.CancelledError:
+                # Still cancel these on Replicate once they've been created.
+                creating.add_done_callback(
+                    lambda f: f.cancelled() or f.exception() or tracker.cancel(f.result())
+                )
+                raise
+
+            for (i, _), prediction in zip(batch, predictions):
+                index[prediction.id] = i
+
+            tracker.add(predictions)
+
+        await submit(concurrency)
+
+        tracked = tracker.track()
+
+        try:
+            async for prediction in tracked:
+                if queue:
+                    await submit(1)
+
+                yield index[prediction.id], prediction
+        finally:
+            await tracked.aclose()
+
+    async def list_predictions(self, cursor: str = None) -> tuple[list[ReplicateResult], str | None]:
+        """
+        List the most recent predictions, returns the predictions and the cursor for the next page.
+        """
+        async with self.session.get(
+            cursor or self.BASE_URL / "predictions", headers=self._get_headers()
+        ) as resp:
+            js = await resp.json()
+
+            if "detail" in js:
+                create_dataclass(js, resp.status)  # Raises ReplicateError
+
+        return [create_dataclass(i, resp.status) for i in js["results"]], js.get("next")
+
+    async def get(self, prediction: ReplicateResult | str) -> ReplicateResult:
         """
         Get a prediction from Replicate asynchronously.
         """
+        prediction_id = prediction if isinstance(prediction, str) else prediction.id
+
         async with self.session.get(
-            self.BASE_URL / "predictions" / prediction.id, headers=self._get_headers()
+            self.BASE_URL / "predictions" / prediction_id, headers=self._get_headers()
+        ) as resp:
+            return create_dataclass(await resp.json(), resp.status)
+
+    async def cancel(self, prediction: ReplicateResult | str) -> ReplicateResult:
+        """
+        Cancel a running prediction.
+        """
+        prediction_id = prediction if isinstance(prediction, str) else prediction.id
+
+        async with self.session.post(
+            self.BASE_URL / "predictions" / prediction_id / "cancel",
+            headers=self._get_headers(),
         ) as resp:
             return create_dataclass(await resp.json(), resp.status)
 
@@ -96,11 +204,32 @@ class Replicate:
         while True:
             response = await self.get(prediction)
 
-            if response.status in ("succeeded", "failed", "canceled"):
+            if response.status in TERMINAL_STATUSES:
                 return response
 
             await asyncio.sleep(1.5)
 
+    async def _wait_for_webhook(self, prediction: ReplicateResult) -> ReplicateResult:
+        """
+        Wait for the prediction's webhook to arrive, polling every `WEBHOOK_POLL_INTERVAL` seconds
+        in case the webhook never gets delivered.
+        """
+        future = self.webhook.wait_for(prediction.id)
+
+        try:
+            while True:
+                try:
+                    return await asyncio.wait_for(
+                        asyncio.shield(future), self.WEBHOOK_POLL_INTERVAL
+                    )
+                except asyncio.TimeoutError:
+                    response = await self.get(prediction)
+
+                    if response.status in TERMINAL_STATUSES:
+                        return response
+        finally:
+            self.webhook.discard(prediction.id)
+
     async def __call__(
         self, model_version: str, *, wait: bool = True, **inputs
     ) -> ReplicateResult:
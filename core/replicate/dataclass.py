@@ -1,5 +1,5 @@
 import datetime
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, fields
 
 
 def from_iso(iso: str = None):
@@ -39,4 +39,7 @@ def create_dataclass(data, status_code: int) -> ReplicateResult:
     if "detail" in data:
         raise ReplicateError(data, status_code)
 
-    return ReplicateResult(**data)
+    # Predictions created with a webhook (and newer API responses) carry extra keys, ignore them.
+    names = {f.name for f in fields(ReplicateResult)}
+
+    return ReplicateResult(**{k: v for k, v in data.items() if k in names})
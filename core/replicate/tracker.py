@@ -0,0 +1,139 @@
+import asyncio
+import typing
+
+from .dataclass import ReplicateResult
+from .webhook import TERMINAL_STATUSES
+
+if typing.TYPE_CHECKING:
+    from .client import Replicate
+
+
+class PredictionTracker:
+    """
+    Tracks several predictions at once.
+
+    Instead of one `GET /predictions/{id}` per prediction per poll, the status of every pending
+    prediction is read from the `GET /predictions` listing (most recent first, so our predictions
+    are usually all on the first page). Webhooks resolve predictions directly when enabled.
+    """
+
+    POLL_INTERVAL = 1.5
+    MAX_PAGES = 3  # Pages of the listing to go through before falling back to per-prediction GETs.
+    _CANCELLING: set[asyncio.Task] = set()  # Keeps cancel requests alive after `track()` exits.
+
+    def __init__(self, replicate: "Replicate") -> None:
+        self.replicate = replicate
+
+        self._pending: dict[str, ReplicateResult] = {}
+        self._finished: list[ReplicateResult] = []
+        self._futures: dict[asyncio.Future, str] = {}
+
+    def add(self, predictions: list[ReplicateResult]) -> None:
+        """
+        Start tracking more predictions, this can be called while `track()` is being iterated.
+        """
+        for prediction in predictions:
+            if prediction.status in TERMINAL_STATUSES:
+                self._finished.append(prediction)
+            else:
+                self._pending[prediction.id] = prediction
+
+                if self.replicate.webhook:
+                    future = self.replicate.webhook.wait_for(prediction.id)
+                    self._futures[future] = prediction.id
+
+    def cancel(self, predictions: typing.Iterable[ReplicateResult]) -> None:
+        """
+        Cancel predictions on Replicate in the background, so it doesn't keep running (and billing)
+        them after we've stopped waiting.
+        """
+        for prediction in predictions:
+            if prediction.status in TERMINAL_STATUSES:
+                continue
+
+            task = asyncio.create_task(self.replicate.cancel(prediction))
+            self._CANCELLING.add(task)
+            task.add_done_callback(self._cancelled)
+
+    @classmethod
+    def _cancelled(cls, task: asyncio.Task) -> None:
+        cls._CANCELLING.discard(task)
+
+        if not task.cancelled():
+            task.exception()  # Best effort, a prediction that already finished can't be cancelled.
+
+    async def poll(self, pending: set[str]) -> list[ReplicateResult]:
+        """
+        Get the latest state of the pending predictions.
+        """
+        found = {}
+        cursor = None
+
+        for _ in range(self.MAX_PAGES):
+            results, cursor = await self.replicate.list_predictions(cursor)
+
+            for result in results:
+                if result.id in pending:
+                    found[result.id] = result
+
+            if len(found) == len(pending) or not cursor:
+                break
+
+        if missing := pending - found.keys():
+            results = await asyncio.gather(*[self.replicate.get(id) for id in missing])
+            found.update({result.id: result for result in results})
+
+        return list(found.values())
+
+    def _finish(self, result: ReplicateResult) -> None:
+        if result.status in TERMINAL_STATUSES and result.id in self._pending:
+            del self._pending[result.id]
+            self._finished.append(result)
+
+    async def track(self) -> typing.AsyncIterator[ReplicateResult]:
+        """
+        Yield each prediction once it has finished, in the order they finish.
+        """
+        webhook = self.replicate.webhook
+        interval = (
+            self.replicate.WEBHOOK_POLL_INTERVAL if webhook else self.POLL_INTERVAL
+        )
+
+        try:
+            while self._pending or self._finished:
+                while self._finished:
+                    yield self._finished.pop(0)
+
+                if not self._pending:
+                    continue
+
+                if self._futures:
+                    done, _ = await asyncio.wait(
+                        self._futures,
+                        timeout=interval,
+                        return_when=asyncio.FIRST_COMPLETED,
+                    )
+
+                    for future in done:
+                        del self._futures[future]
+
+                        if not future.cancelled():
+                            self._finish(future.result())
+
+                    if done:
+                        continue
+                else:
+                    await asyncio.sleep(interval)
+
+                for result in await self.poll(set(self._pending)):
+                    self._finish(result)
+        finally:
+            # Stopped before everything finished, e.g. the prompt was rejected.
+            self.cancel(self._pending.values())
+            self._pending.clear()
+
+            if webhook:
+                for id in self._futures.values():
+                    webhook.discard(id)
+
+                self._futures.clear()
@@ -0,0 +1,63 @@
+import asyncio
+import time
+import typing
+
+
+class VersionResolver:
+    """
+    Caches `owner/model:latest` -> version id lookups, shared by every `Replicate` instance.
+
+    Fresh entries are returned as is. Stale entries are still returned, but a refresh is started in
+    the background so the next call gets the new version without waiting on it.
+    """
+
+    def __init__(self, ttl: int | float = 60 * 60) -> None:
+        self.ttl = ttl
+
+        self._versions: dict[tuple[str, str], tuple[str, float]] = {}
+        self._refreshing: dict[tuple[str, str], asyncio.Task] = {}
+
+    def _refresh(
+        self,
+        key: tuple[str, str],
+        fetch: typing.Callable[[str, str], typing.Awaitable[str]],
+    ) -> asyncio.Task:
+        if task := self._refreshing.get(key):
+            return task
+
+        async def refresh() -> str:
+            try:
+                version = await fetch(*key)
+                self._versions[key] = (version, time.monotonic())
+                return version
+            finally:
+                self._refreshing.pop(key, None)
+
+        task = asyncio.create_task(refresh())
+        self._refreshing[key] = task
+
+        return task
+
+    async def resolve(
+        self,
+        owner: str,
+        model: str,
+        fetch: typing.Callable[[str, str], typing.Awaitable[str]],
+    ) -> str:
+        key = (owner, model)
+
+        if cached := self._versions.get(key):
+            version, fetched_at = cached
+
+            if time.monotonic() - fetched_at >= self.ttl:
+                task = self._refresh(key, fetch)
+                # Keep serving the stale version if the refresh fails.
+                task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+            return version
+
+        # Nothing cached yet, every concurrent caller waits on the same request.
+        return await asyncio.shield(self._refresh(key, fetch))
+
+    def invalidate(self, owner: str, model: str) -> None:
+        self._versions.pop((owner, model), None)
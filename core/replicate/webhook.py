@@ -0,0 +1,148 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import time
+
+import cachetools
+from aiohttp import web
+
+from .dataclass import ReplicateResult, create_dataclass
+
+TERMINAL_STATUSES = ("succeeded", "failed", "canceled")
+
+
+# Replicate POSTs the prediction to the webhook URL once it is done, this resolves the futures
+# `Replicate.run(wait=True)` is waiting on so we don't have to poll `GET /predictions/{id}` every 1.5s.
+class ReplicateWebhook:
+    # How far `webhook-timestamp` may be from our clock, older deliveries could be replays.
+    TIMESTAMP_TOLERANCE = 5 * 60
+
+    def __init__(
+        self,
+        url: str,
+        *,
+        host: str = "0.0.0.0",
+        port: int = 8080,
+        path: str = "/replicate/webhook",
+        secret: str = None,
+    ) -> None:
+        self.url = url
+        self.host = host
+        self.port = port
+        self.path = path
+        self.secret = secret
+
+        self._waiters: dict[str, asyncio.Future] = {}
+        # Webhooks that arrived before anyone started waiting for them (e.g. the prediction finished
+        # before the POST /predictions response was read).
+        self._early = cachetools.TTLCache(maxsize=1024, ttl=60)
+
+        self._runner: web.AppRunner | None = None
+
+    async def start(self) -> None:
+        # Without a secret anyone could POST a "finished" prediction with whatever output they like.
+        if not self.secret:
+            raise RuntimeError("Refusing to start the Replicate webhook receiver without a secret.")
+
+        app = web.Application()
+        app.router.add_post(self.path, self._handle)
+
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+
+    async def close(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+        for future in self._waiters.values():
+            future.cancel()
+
+        self._waiters.clear()
+
+    def wait_for(self, prediction_id: str) -> asyncio.Future:
+        """
+        Get a future that resolves with the finished prediction once its webhook arrives.
+        """
+        if prediction_id in self._waiters:
+            return self._waiters[prediction_id]
+
+        future = asyncio.get_running_loop().create_future()
+
+        if (result := self._early.pop(prediction_id, None)) is not None:
+            future.set_result(result)
+        else:
+            self._waiters[prediction_id] = future
+
+        return future
+
+    def discard(self, prediction_id: str) -> None:
+        future = self._waiters.pop(prediction_id, None)
+
+        if future and not future.done():
+            future.cancel()
+
+    def resolve(self, result: ReplicateResult) -> None:
+        if result.status not in TERMINAL_STATUSES:
+            return
+
+        future = self._waiters.pop(result.id, None)
+
+        if future is None:
+            self._early[result.id] = result
+        elif not future.done():
+            future.set_result(result)
+
+    def verify(self, headers, body: bytes) -> bool:
+        """
+        Verify the webhook signature. See https://replicate.com/docs/webhooks#verifying-webhooks
+        """
+        if not self.secret:
+            return False
+
+        webhook_id = headers.get("webhook-id")
+        timestamp = headers.get("webhook-timestamp")
+        signatures = headers.get("webhook-signature")
+
+        if not webhook_id or not timestamp or not signatures:
+            return False
+
+        try:
+            if abs(time.time() - int(timestamp)) > self.TIMESTAMP_TOLERANCE:
+                return False
+        except ValueError:
+            return False
+
+        key = base64.b64decode(self.secret.removeprefix("whsec_"))
+        content = f"{webhook_id}.{timestamp}.".encode() + body
+        expected = base64.b64encode(
+            hmac.new(key, content, hashlib.sha256).digest()
+        ).decode()
+
+        for signature in signatures.split():
+            _, _, sig = signature.partition(",")
+
+            if hmac.compare_digest(sig, expected):
+                return True
+
+        return False
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        body = await request.read()
+
+        if not self.verify(request.headers, body):
+            return web.Response(status=401)
+
+        try:
+            result = create_dataclass(json.loads(body), 200)
+        except Exception:
+            return web.Response(status=400)
+
+        self.resolve(result)
+
+        return web.Response(status=204)
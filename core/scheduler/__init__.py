@@ -0,0 +1,187 @@
+import asyncio
+import collections
+import contextlib
+import typing
+
+
+class QueueFull(Exception):
+    pass
+
+
+class TooManyJobs(Exception):
+    pass
+
+
+class _Job:
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self.position = 0  # 0 means running
+        self.started = False
+        self.changed = asyncio.Event()
+
+
+class _ProviderQueue:
+    def __init__(self, concurrency: int):
+        self.concurrency = concurrency
+        self.running = 0
+        self.active: collections.Counter[int] = collections.Counter()  # Running jobs per user
+        # When each user last had a job started, users who were never served go first.
+        self.last_served: dict[int, int] = {}
+        self.served = 0
+        self.users: dict[int, collections.deque[_Job]] = {}  # Queued jobs per user
+
+    def __len__(self) -> int:
+        return sum(len(jobs) for jobs in self.users.values())
+
+    @staticmethod
+    def _next(
+        users: dict[int, collections.deque[_Job]],
+        active: collections.Counter,
+        last_served: dict[int, int],
+        served: int,
+    ) -> _Job:
+        # Fewest running jobs goes next, ties go to whoever was served longest ago.
+        user_id = min(users, key=lambda u: (active[u], last_served.get(u, -1)))
+        jobs = users[user_id]
+        job = jobs.popleft()
+
+        if not jobs:
+            del users[user_id]
+
+        active[user_id] += 1
+        last_served[user_id] = served
+
+        return job
+
+    def pop(self) -> _Job:
+        self.served += 1
+
+        return self._next(self.users, self.active, self.last_served, self.served)
+
+    def order(self) -> list[_Job]:
+        """
+        The order queued jobs will start in (assuming no running job finishes first).
+        """
+        users = {user_id: collections.deque(jobs) for user_id, jobs in self.users.items()}
+        active = self.active.copy()
+        last_served = self.last_served.copy()
+
+        return [
+            self._next(users, active, last_served, self.served + i)
+            for i in range(1, len(self) + 1)
+        ]
+
+    def forget(self) -> None:
+        # With nobody waiting, only the users still running need their place remembered.
+        if not self.users:
+            self.last_served = {
+                u: n for u, n in self.last_served.items() if self.active[u]
+            }
+
+
+class JobScheduler:
+    """
+    Limits how many jobs run at once per provider, sharing the slots fairly between users.
+
+    Queued jobs are started round robin across users: users with fewer running jobs go first, then
+    whoever had a job started longest ago, so one user queueing several jobs can't starve everyone
+    else. Queue positions are reported back through the `on_position` callback of `slot()`.
+    """
+
+    def __init__(
+        self,
+        concurrency: dict[str, int],
+        *,
+        max_depth: int = 20,
+        max_per_user: int = 2,
+    ):
+        self.max_depth = max_depth
+        self.max_per_user = max_per_user
+
+        self._queues = {
+            provider: _ProviderQueue(limit) for provider, limit in concurrency.items()
+        }
+        self._jobs: collections.Counter[tuple[str, int]] = collections.Counter()
+
+    def depth(self, provider: str) -> int:
+        return len(self._queues[provider])
+
+    def _update(self, queue: _ProviderQueue) -> None:
+        # Start as many jobs as there are free slots
+        while queue.running < queue.concurrency and queue.users:
+            job = queue.pop()
+
+            queue.running += 1
+            job.started = True
+            job.position = 0
+            job.changed.set()
+
+        for position, job in enumerate(queue.order(), start=1):
+            if job.position != position:
+                job.position = position
+                job.changed.set()
+
+    def _remove(self, queue: _ProviderQueue, job: _Job) -> None:
+        jobs = queue.users.get(job.user_id)
+
+        if jobs and job in jobs:
+            jobs.remove(job)
+
+            if not jobs:
+                del queue.users[job.user_id]
+
+    @contextlib.asynccontextmanager
+    async def slot(
+        self,
+        provider: str,
+        user_id: int,
+        *,
+        on_position: typing.Callable[[int], typing.Awaitable[None]] = None,
+    ) -> typing.AsyncIterator[None]:
+        """
+        Wait for a free slot of `provider`, raises `QueueFull` or `TooManyJobs` instead of queueing
+        when the queue is too deep or the user already has too many jobs.
+        """
+        queue = self._queues[provider]
+        key = (provider, user_id)
+
+        if self._jobs[key] >= self.max_per_user:
+            raise TooManyJobs()
+
+        if queue.running >= queue.concurrency and len(queue) >= self.max_depth:
+            raise QueueFull()
+
+        job = _Job(user_id)
+        queue.users.setdefault(user_id, collections.deque()).append(job)
+        self._jobs[key] += 1
+
+        try:
+            self._update(queue)
+
+            while not job.started:
+                job.changed.clear()
+
+                if on_position:
+                    await on_position(job.position)
+
+                if not job.started:
+                    await job.changed.wait()
+
+            yield
+        finally:
+            self._jobs[key] -= 1
+
+            if not self._jobs[key]:
+                del self._jobs[key]
+
+            if job.started:
+                queue.running -= 1
+                queue.active[user_id] -= 1
+
+                if not queue.active[user_id]:
+                    del queue.active[user_id]
+            else:
+                self._remove(queue, job)
+
+            self._update(queue)
+            queue.forget()
@@ -5,6 +5,8 @@ from difflib import get_close_matches as find_match_difflib
 import aiohttp
 from thefuzz.process import extractBests as find_match_fuzzy
 
+from core.fetch import Fetcher
+
 
 @dataclass
 class TranslateOCRResult:
@@ -19,6 +21,7 @@ class TranslateOCR:
 
     def __init__(self, session: aiohttp.ClientSession, *, api_version="2"):
         self.session: aiohttp.ClientSession = session
+        self.fetcher = Fetcher(session)
         self.api_version = api_version
         self.url = self.URL.format(api_version)
 
@@ -26,10 +29,7 @@ class TranslateOCR:
         self.languages_all = []
 
     async def read_img_from_url(self, url: str) -> bytes:
-        async with self.session.get(url) as resp:
-            img = await resp.read()
-
-        return img
+        return await self.fetcher.read(url, types=("image/",))
 
     async def get_languages(self, *, all: bool = False) -> list[dict[str, str]]:
         if self.languages_all and all:
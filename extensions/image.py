@@ -2,10 +2,7 @@ from __future__ import annotations
 
 import asyncio
 import importlib
-import json
 import typing
-import uuid
-from io import BytesIO
 from typing import TYPE_CHECKING
 
 import discord
@@ -13,12 +10,13 @@ import openai
 from discord import app_commands
 from discord.app_commands import locale_str as _T
 from discord.ext import commands
-from jishaku.functools import executor_function
-from PIL import Image as PILImg
 
 import config
 from core import image as core_image
 from core.context import Context
+from core.fetch import Fetcher, FetchError
+from core.moderation import BLOCKLIST, Moderation, PromptRejected, speculate
+from core.scheduler import JobScheduler, QueueFull, TooManyJobs
 from core.image import GeneratedImages, Size
 from core.image import firefly as core_firefly
 from core.image import midjourney as core_midjourney
@@ -29,6 +27,7 @@ from utils.image import (
     DalleImagesPaginator,
     FireflyTextToImagePaginator,
     MidjourneyPaginator,
+    set_preview,
 )
 from utils.paginator import YodaMenuPages
 
@@ -41,6 +40,8 @@ class Image(commands.Cog):
     Image utilities such as generating art from prompts or images!
     """
 
+    SPECULATIVE_MODERATION = True
+
     def __init__(self, bot: Bot):
         self.image = None
         self.bot: Bot = bot
@@ -54,59 +55,70 @@ class Image(commands.Cog):
         - Threats
         - Sexual
         - etc.
+
+        Verdicts are cached per prompt and obvious rejections are caught locally, see `core.moderation`.
+        """
+
+        if raw:
+            return await self.moderation.analyze(text)
+
+        decision = await self.moderation.check(text)
+
+        return decision.allowed
+
+    async def moderated(self, ctx, prompt, generate):
+        """
+        Run `generate(approval)` for a prompt that has to pass moderation.
+
+        Prompts the blocklist or cache already decided on never start a generation. Otherwise, with
+        `SPECULATIVE_MODERATION`, moderation and generation run at the same time and the generation
+        is cancelled (before anything gets uploaded) if the prompt is rejected.
+        Raises `PromptRejected` when the prompt is rejected.
+        """
+        if await self.bot.is_owner(ctx.author):
+            return await generate(None)
+
+        if (decision := self.moderation.precheck(prompt)) is not None:
+            if not decision.allowed:
+                raise PromptRejected()
+
+            return await generate(None)
+
+        if not self.SPECULATIVE_MODERATION:
+            if not await self.text_check(prompt):
+                raise PromptRejected()
+
+            return await generate(None)
+
+        return await speculate(self.text_check(prompt), generate)
+
+    async def moderated_stream(self, ctx, prompt, iterate):
         """
+        `moderated` for generators that yield results as they're uploaded, `iterate(approval)`
+        returns the async iterator.
 
-        url = "https://commentanalyzer.googleapis.com/v1alpha1/comments:analyze"
-
-        body = {
-            "comment": {
-                "text": text,
-            },
-            "requestedAttributes": {
-                "TOXICITY": {
-                    "scoreThreshold": 0.75,
-                },
-                "SEVERE_TOXICITY": {
-                    "scoreThreshold": 0.75,
-                },
-                "IDENTITY_ATTACK": {
-                    "scoreThreshold": 0.75,
-                },
-                "INSULT": {
-                    "scoreThreshold": 0.75,
-                },
-                "PROFANITY": {
-                    "scoreThreshold": 0.75,
-                },
-                "THREAT": {
-                    "scoreThreshold": 0.75,
-                },
-                "SEXUALLY_EXPLICIT": {
-                    "scoreThreshold": 0.75,
-                },
-                "FLIRTATION": {
-                    "scoreThreshold": 0.75,
-                },
-            },
-            "languages": ["en"],
-        }
-
-        params = {
-            "key": config.PERSPECTIVE_KEY,
-        }
-
-        async with self.bot.session.post(
-            url, data=json.dumps(body), params=params
-        ) as resp:
-            js = await resp.json()
-
-            if raw:
-                return js
-
-            if js.get("attributeScores"):
-                return False
-
-        return True
+        Moderation runs alongside the first result, returns that result and the iterator for the rest.
+        """
+        results = None
+
+        def first(approval):
+            nonlocal results
+            results = iterate(approval)
+            return anext(results)
+
+        return await self.moderated(ctx, prompt, first), results
+
+    async def paginate_stream(self, ctx, source, results):
+        """
+        Start the menu with the pages we have and add the rest as they come in.
+        """
+        menu = YodaMenuPages(source)
+        await menu.start(ctx)
+
+        async for result in results:
+            await menu.add_entry(result)
+
+        return menu
 
     async def cog_load(self):
         importlib.reload(core_image)
@@ -123,8 +135,29 @@ class Image(commands.Cog):
                 config.REPLICATE_API_KEY,
                 config.FIREFLY_KEY,
             ),
+            pool=self.bot.pool,
+        )
+        self.upscaling = Upscaling(
+            config.REPLICATE_API_KEY,
+            self.bot.session,
+            cdn=self.image.cdn,
+            pool=self.bot.pool,
         )
-        self.upscaling = Upscaling(config.REPLICATE_API_KEY, self.bot.session)
+        self.fetcher = Fetcher(self.bot.session)
+        self.moderation = Moderation(
+            config.PERSPECTIVE_KEY,
+            session=self.bot.session,
+            blocklist=BLOCKLIST + tuple(getattr(config, "MODERATION_BLOCKLIST", ())),
+        )
+
+        style = self.image.style
+
+        try:
+            await style.refresh_styles()
+        except Exception:
+            pass  # Loaded lazily on the first art command instead.
+
+        style.CATALOGUE.start(style.fetch_styles)
         # app_commands.choices(
         #     size=[
         #         app_commands.Choice(name=f"{k} ({v[0][0]}:{v[0][1]})", value=k)
@@ -133,54 +166,40 @@ class Image(commands.Cog):
         # )(self.firefly_slash)
 
     async def cog_unload(self):
-        del self.image
-
-    @executor_function
-    def _convert_img(self, img):
-        # idk tbh
-        p_img = PILImg.open(BytesIO(img))
-        if len(img) > 1024 * 1024 * 4:
-            if p_img.size[0] > 1024 and p_img.size[1] > 1024:
-                p_img = p_img.resize((1024, 1024))
-            elif p_img.size[0] > 512 and p_img.size[1] > 512:
-                p_img = p_img.resize((512, 512))
-            else:
-                p_img = p_img.resize((256, 256))
+        self.image.style.CATALOGUE.stop()
+        # The preprocessor's pool is shared with other cogs, the bot shuts it down on close.
 
-        new_img = BytesIO()
-        p_img.save(new_img, format="PNG")
-        new_img.seek(0)
-        new_img = img.getvalue()
-
-        return new_img
+        del self.image
 
     async def generate_image(self, ctx, prompt, amount, size):
         if ctx.interaction:
-            await ctx.defer()
+            if not ctx.interaction.response.is_done():  # Already responded with a queue position
+                await ctx.defer()
+
             m = None
         else:
             m = await ctx.send(f"⌛ Generating `{amount}` image(s)...")
 
-        if not await self.bot.is_owner(ctx.author):
-            check = await self.text_check(prompt)
-
-            if not check:
-                await m.delete()
-                return await ctx.send(
-                    "Text seems inappropriate. Aborting.", ephemeral=True
-                )
-
         try:
-            result = await self.image.create_image(
-                prompt, amount, size=size, user=str(ctx.author.id)
+            first, results = await self.moderated_stream(
+                ctx,
+                prompt,
+                lambda approval: self.image.iter_create_image(
+                    prompt, amount, size=size, user=str(ctx.author.id), approval=approval
+                ),
             )
+        except PromptRejected:
+            if m:
+                await m.delete()
+
+            return await ctx.send("Text seems inappropriate. Aborting.", ephemeral=True)
         except Exception as e:
             if m:
                 await m.delete()
 
             self.bot.dispatch("command_error", ctx, e, force=True, send_msg=False)
 
-            if isinstance(e, openai.error.InvalidRequestError):
+            if isinstance(e, openai.BadRequestError):
                 return await ctx.send(f"Invalid prompt. {e}", ephemeral=True)
 
             return await ctx.send(
@@ -190,19 +209,17 @@ class Image(commands.Cog):
         if m:
             await m.delete()
 
-        source = DalleImagesPaginator(result.images, "Image Generation", prompt)
-        menu = YodaMenuPages(source)
+        source = DalleImagesPaginator([first], "Image Generation", prompt)
 
-        return await menu.start(ctx)
+        return await self.paginate_stream(ctx, source, results)
 
     async def variations(self, ctx, url, amount, size):
-        async with self.bot.session.get(url) as resp:
-            ori_img = await resp.read()
-
-        img = await self._convert_img(ori_img)
+        img = await self.fetcher.read(url, types=("image/",))
 
         if ctx.interaction:
-            await ctx.defer()
+            if not ctx.interaction.response.is_done():  # Already responded with a queue position
+                await ctx.defer()
+
             m = None
         else:
             m = await ctx.send(f"⌛ Generating `{amount}` variation(s)...")
@@ -217,7 +234,7 @@ class Image(commands.Cog):
 
             self.bot.dispatch("command_error", ctx, e, force=True, send_msg=False)
 
-            if isinstance(e, openai.error.InvalidRequestError):
+            if isinstance(e, openai.BadRequestError):
                 return await ctx.send(f"Invalid image. {e}", ephemeral=True)
 
             return await ctx.send(
@@ -234,26 +251,28 @@ class Image(commands.Cog):
 
     async def generate_image_style(self, ctx, prompt, style, amount, width, height):
         if ctx.interaction:
-            await ctx.defer()
+            if not ctx.interaction.response.is_done():  # Already responded with a queue position
+                await ctx.defer()
+
             m = None
         else:
             m = await ctx.send(
                 f"⌛ Generating `{amount}` image(s) with style `{style.name}`..."
             )
 
-        if not await self.bot.is_owner(ctx.author):
-            check = await self.text_check(prompt)
-
-            if not check:
-                await m.delete()
-                return await ctx.send(
-                    "Text seems inappropriate. Aborting.", ephemeral=True
-                )
-
         try:
-            result = await self.image.style.generate(
-                prompt, style, amount, height=height, width=width
+            first, results = await self.moderated_stream(
+                ctx,
+                prompt,
+                lambda approval: self.image.style.iter_generate(
+                    prompt, style, amount, height=height, width=width, approval=approval
+                ),
             )
+        except PromptRejected:
+            if m:
+                await m.delete()
+
+            return await ctx.send("Text seems inappropriate. Aborting.", ephemeral=True)
         except Exception as e:
             if m:
                 await m.delete()
@@ -267,31 +286,32 @@ class Image(commands.Cog):
         if m:
             await m.delete()
 
-        source = DalleArtPaginator(result, prompt)
-        menu = YodaMenuPages(source)
+        source = DalleArtPaginator([first], prompt)
 
-        return await menu.start(ctx)
+        return await self.paginate_stream(ctx, source, results)
 
     async def midjourney_imagine(self, ctx, prompt, amount, width, height):
         if ctx.interaction:
-            await ctx.defer()
+            if not ctx.interaction.response.is_done():  # Already responded with a queue position
+                await ctx.defer()
+
             m = None
         else:
             m = await ctx.send(f"⌛ Generating `{amount}` image(s)...")
 
-        if not await self.bot.is_owner(ctx.author):
-            check = await self.text_check(prompt)
-
-            if not check:
-                await m.delete()
-                return await ctx.send(
-                    "Text seems inappropriate. Aborting.", ephemeral=True
-                )
-
         try:
-            result = await self.image.midjourney.generate(
-                prompt, amount, height=height, width=width
+            result = await self.moderated(
+                ctx,
+                prompt,
+                lambda approval: self.image.midjourney.generate(
+                    prompt, amount, height=height, width=width, approval=approval
+                ),
             )
+        except PromptRejected:
+            if m:
+                await m.delete()
+
+            return await ctx.send("Text seems inappropriate. Aborting.", ephemeral=True)
         except Exception as e:
             if m:
                 await m.delete()
@@ -312,27 +332,34 @@ class Image(commands.Cog):
 
     async def firefly_text_to_image(self, ctx, prompt, amount, size, styles=None):
         if ctx.interaction:
-            await ctx.defer()
+            if not ctx.interaction.response.is_done():  # Already responded with a queue position
+                await ctx.defer()
+
             m = None
         else:
             m = await ctx.send(f"⌛ Generating `{amount}` image(s)...")
 
-        if not await self.bot.is_owner(ctx.author):
-            check = await self.text_check(prompt)
-
-            if not check:
-                await m.delete()
-                return await ctx.send(
-                    "Text seems inappropriate. Aborting.", ephemeral=True
-                )
-
         width = self.image.firefly.SIZES[size][1]
         height = self.image.firefly.SIZES[size][2]
 
         try:
-            results = await self.image.firefly.text_to_image(
-                prompt, amount, width=width, height=height, styles=styles
+            first, results = await self.moderated_stream(
+                ctx,
+                prompt,
+                lambda approval: self.image.firefly.iter_text_to_image(
+                    prompt,
+                    amount,
+                    width=width,
+                    height=height,
+                    styles=styles,
+                    approval=approval,
+                ),
             )
+        except PromptRejected:
+            if m:
+                await m.delete()
+
+            return await ctx.send("Text seems inappropriate. Aborting.", ephemeral=True)
         except Exception as e:
             if m:
                 await m.delete()
@@ -347,33 +374,69 @@ class Image(commands.Cog):
             await m.delete()
 
         source = FireflyTextToImagePaginator(
-            results, prompt, res_high=(size in ["Ultrawide", "Ultrawide Portrait"])
+            [first], prompt, res_high=(size in ["Ultrawide", "Ultrawide Portrait"])
         )
-        menu = YodaMenuPages(source)
 
-        return await menu.start(ctx)
+        return await self.paginate_stream(ctx, source, results)
 
-    MAX_CONCURRENCY = commands.MaxConcurrency(
-        1, per=commands.BucketType.member, wait=False
-    )
+    # Jobs running at once across the whole bot, per provider.
+    PROVIDER_CONCURRENCY = {
+        "dalle": 4,
+        "style": 2,
+        "midjourney": 2,
+        "firefly": 2,
+        "upscale": 2,
+    }
+    SCHEDULER = JobScheduler(PROVIDER_CONCURRENCY, max_depth=20, max_per_user=2)
 
-    async def handle(self, ctx, func, *args, **kwargs):
+    async def handle(self, ctx, func, *args, provider: str = "dalle", **kwargs):
         if isinstance(ctx, discord.Interaction):
             ctx = await self.bot.get_context(ctx)
 
+        action = "upscaling" if provider == "upscale" else "generating"
+        notice = None
+
+        async def on_position(position: int):
+            nonlocal notice
+
+            content = f"⏳ You are #{position} in the queue, {action} will start soon..."
+
+            if ctx.interaction:
+                if notice is None:
+                    await ctx.interaction.response.send_message(content, ephemeral=True)
+                    notice = ctx.interaction
+                else:
+                    await ctx.interaction.edit_original_response(content=content)
+            elif notice is None:
+                notice = await ctx.send(content, embed_content=False)
+            else:
+                await notice.edit(content=content)
+
         try:
-            await self.MAX_CONCURRENCY.acquire(ctx)
+            async with self.SCHEDULER.slot(
+                provider, ctx.author.id, on_position=on_position
+            ):
+                if isinstance(notice, discord.Interaction):
+                    await notice.delete_original_response()
+                elif notice is not None:
+                    await notice.delete()
 
-            try:
                 await func(ctx, *args, **kwargs)
-            finally:
-                await self.MAX_CONCURRENCY.release(ctx)
-        except commands.MaxConcurrencyReached:
+        except TooManyJobs:
+            await ctx.send(
+                f"You are already {action} an image. Please wait until it's done.",
+                ephemeral=True,
+            )
+            return
+        except QueueFull:
             await ctx.send(
-                "You are already generating an image. Please wait until it's done.",
+                "Too many people are using this right now. Please try again in a few minutes.",
                 ephemeral=True,
             )
             return
+        except FetchError as e:
+            await ctx.send(str(e), ephemeral=True)
+            return
 
     @commands.group(
         "generate-art",
@@ -565,7 +628,7 @@ class Image(commands.Cog):
                 ctx, prompt, style, amount, width, height
             )
 
-        await self.handle(ctx, main, prompt, style, amount, size)
+        await self.handle(ctx, main, prompt, style, amount, size, provider="style")
 
     @commands.command("imagine", aliases=["midjourney", "mj"])
     async def midjourney_imagine_cmd(
@@ -604,7 +667,7 @@ class Image(commands.Cog):
 
             return await self.midjourney_imagine(ctx, prompt, amount, width, height)
 
-        await self.handle(ctx, main, prompt, amount, size)
+        await self.handle(ctx, main, prompt, amount, size, provider="midjourney")
 
     # @commands.command("firefly", aliases=["ff"])
     # async def firefly_cmd(
@@ -626,7 +689,7 @@ class Image(commands.Cog):
     #     async def main(ctx, prompt, amount, size):
     #         return await self.firefly_text_to_image(ctx, prompt, amount, size)
 
-    #     await self.handle(ctx, main, prompt, amount, size)
+    #     await self.handle(ctx, main, prompt, amount, size, provider="firefly")
 
     gen_art_slash = app_commands.Group(
         name=_T("generate-art"), description=_T("Generate an image from a prompt.")
@@ -801,27 +864,18 @@ class Image(commands.Cog):
                 ctx, prompt, style, amount, width, height
             )
 
-        await self.handle(interaction, main, prompt, style, amount, size)
+        await self.handle(
+            interaction, main, prompt, style, amount, size, provider="style"
+        )
 
     @gen_art_style_slash.autocomplete("style")
     async def gen_art_style_slash_autocomplete(
         self, interaction: discord.Interaction, current: str
     ):
-        if not current:
-            return [
-                app_commands.Choice(name=style.name, value=style.name)
-                for style in await self.image.style.get_styles(raw=True)
-            ][:25]
-
-        styles = []
-
-        for style in await self.image.style.get_styles(raw=True):
-            if current.lower() in style.name.lower():
-                styles.append(app_commands.Choice(name=style.name, value=style.name))
-
-        styles = styles[:25]
-
-        return styles
+        return [
+            app_commands.Choice(name=style.name, value=style.name)
+            for style in self.image.style.CATALOGUE.search(current, limit=25)
+        ]
 
     @app_commands.command(name=_T("imagine"))
     @app_commands.describe(
@@ -866,7 +920,9 @@ class Image(commands.Cog):
 
             return await self.midjourney_imagine(ctx, prompt, amount, width, height)
 
-        await self.handle(interaction, main, prompt, amount, (width, height))
+        await self.handle(
+            interaction, main, prompt, amount, (width, height), provider="midjourney"
+        )
 
     # @app_commands.command(name=_T("firefly"))
     # @app_commands.describe(
@@ -892,12 +948,11 @@ class Image(commands.Cog):
     #     async def main(ctx, prompt, amount, size):
     #         return await self.firefly_text_to_image(ctx, prompt, amount, size)
 
-    #     await self.handle(interaction, main, prompt, amount, size)
+    #     await self.handle(interaction, main, prompt, amount, size, provider="firefly")
 
     async def analyze_image(self, ctx, url):
         async with ctx.typing():
-            async with self.bot.session.get(url) as resp:
-                image = await resp.read()
+            image = await self.fetcher.read(url, types=("image/",))
 
             result = await self.image.analyze(image)
 
@@ -1036,6 +1091,9 @@ class Image(commands.Cog):
                 ephemeral=True,
             )
             return
+        except FetchError as e:
+            await ctx.send(str(e), ephemeral=True)
+            return
 
     @commands.command(
         "analyze-image", aliases=["analyze-img", "analyze_img", "analyze_image"]
@@ -1106,38 +1164,15 @@ class Image(commands.Cog):
 
     async def upscale_image(self, ctx, image, scale):
         async with ctx.typing():
-            img = await self.upscaling(image, scale=scale)
-
-            key = f"upscaling/{uuid.uuid4().hex}.png"
-
-            self.bot.cdn.upload_fileobj(img, "yodabot", key)
+            url = await self.upscaling.upscale_to_cdn(image, scale=scale)
 
             embed = discord.Embed(title="Image Upscaling Result:", color=self.bot.color)
-            embed.set_image(url=f"https://cdn.yodabot.xyz/{key}")
+            set_preview(embed, url)
 
             return embed
 
-    MAX_CONCURRENCY_UPSCALE = commands.MaxConcurrency(
-        1, per=commands.BucketType.member, wait=False
-    )
-
     async def handle_upscale_image(self, ctx, func, *args, **kwargs):
-        if isinstance(ctx, discord.Interaction):
-            ctx = await self.bot.get_context(ctx)
-
-        try:
-            await self.MAX_CONCURRENCY_UPSCALE.acquire(ctx)
-
-            try:
-                await func(ctx, *args, **kwargs)
-            finally:
-                await self.MAX_CONCURRENCY_UPSCALE.release(ctx)
-        except commands.MaxConcurrencyReached:
-            await ctx.send(
-                "You are already upscaling an image. Please wait until it's done.",
-                ephemeral=True,
-            )
-            return
+        return await self.handle(ctx, func, *args, provider="upscale", **kwargs)
 
     @commands.command(
         "upscale", aliases=["upscale-img", "upscale_img", "upscaleimg", "ui"]
@@ -14,6 +14,7 @@ from discord.ext import commands
 
 from core import maps
 from core.context import Context
+from core.image.preprocess import ImagePreprocessor
 from core.maps import SlashMaps
 from utils.maps import MapsView
 
@@ -44,6 +45,7 @@ class Maps(commands.Cog):
 
     def __init__(self, bot: Bot):
         self.bot: Bot = bot
+        self.preprocessor = ImagePreprocessor()
 
     async def cog_load(self):
         importlib.reload(maps)
@@ -219,12 +221,18 @@ Periods:
                 map_theme=map_theme,
                 geometry=place["geometry"],
             )
-            f = discord.File(io.BytesIO(img), filename="map.png")
+            try:
+                img = await self.preprocessor.encode_webp(img)
+                filename = "map.webp"
+            except Exception:
+                filename = "map.png"
+
+            f = discord.File(io.BytesIO(img), filename=filename)
 
             maps.delete_session()
 
             embed = discord.Embed(color=self.bot.color)
-            embed.set_image(url="attachment://map.png")
+            embed.set_image(url=f"attachment://{filename}")
 
             embed = self.format_embed(place, embed)
 
@@ -9,6 +9,7 @@ from discord.app_commands import locale_str as _T
 from discord.ext import commands
 
 from core.context import Context
+from core.fetch import FetchError
 from core.music import *
 from utils.converter import AttachmentConverter
 from utils.lyrics import *
@@ -31,9 +32,13 @@ class Music(commands.Cog):
             ),
             loop=self.bot.loop,
             session=self.bot.session,
+            pool=self.bot.pool,
         )
         self.gpred = GenrePrediction(session=self.bot.session)
 
+    async def cog_unload(self):
+        await self._lyrics.close()
+
     @commands.hybrid_command(_T("lyrics"), aliases=["lyric"])
     @app_commands.describe(query=_T("The song's lyrics to search for."))
     async def lyrics(self, ctx: Context, *, query: str):
@@ -47,9 +52,7 @@ class Music(commands.Cog):
             if res == LyricResult.empty() or not res.lyrics:
                 return await ctx.send("No results found.")
 
-            pages = paginate_lyric_result(res)
-
-            source = LyricsPaginator(pages)
+            source = LyricsPaginator(res)
 
             menu = YodaMenuPages(source=source)
 
@@ -62,17 +65,20 @@ class Music(commands.Cog):
         if not current:
             return []
 
-        suggestions = await self._lyrics.autocomplete(current, slash_autocomplete=True)
+        suggestions = await self._lyrics.slash_autocomplete(interaction.user.id, current)
 
         return suggestions
 
     async def predict_genre(self, file: str | discord.Attachment, mode: str):
         if isinstance(file, discord.Attachment):
-            file = await file.read()
+            file = file.url  # Streamed by GenrePrediction instead of read into memory
 
-        res, start, end, elapsed = await self.gpred(file, mode=mode)
+        try:
+            res, start, end, elapsed = await self.gpred(file, mode=mode)
+        except FetchError as e:
+            return str(e)
 
-        if not res:
+        if not self.gpred.successful(res):
             return "NO_RESULT"
 
         embed = discord.Embed(color=self.bot.color)
@@ -130,6 +136,9 @@ class Music(commands.Cog):
 
                 await m.delete()
 
+                if isinstance(result, str):  # Couldn't download the file
+                    return await ctx.send(result)
+
                 return await ctx.send(embed=result)
         finally:
             await self.PREDICT_GENRE_MAX_CONCURRENCY.release(ctx.message)
@@ -174,6 +183,9 @@ class Music(commands.Cog):
             if result == "NO_RESULT":
                 return await interaction.followup.send("No results found.")
 
+            if isinstance(result, str):  # Couldn't download the file
+                return await interaction.followup.send(result)
+
             return await interaction.followup.send(embed=result)
         finally:
             await self.PREDICT_GENRE_MAX_CONCURRENCY.release(ctx.message)
@@ -15,4 +15,23 @@ CREATE TABLE IF NOT EXISTS chat(
     ttl TIMESTAMPTZ DEFAULT now() + interval '3 minutes',
     is_google BOOLEAN DEFAULT FALSE,
     PRIMARY KEY (id, user_id, channel_id)
-);
\ No newline at end of file
+);
+CREATE TABLE IF NOT EXISTS image_analysis (
+    hash TEXT PRIMARY KEY,
+    result JSON NOT NULL,
+    ttl TIMESTAMPTZ DEFAULT now() + interval '1 month'
+);
+
+CREATE TABLE IF NOT EXISTS upscales (
+    hash TEXT,
+    scale INTEGER,
+    url TEXT NOT NULL,
+    ttl TIMESTAMPTZ DEFAULT now() + interval '1 month',
+    PRIMARY KEY (hash, scale)
+);
+
+CREATE TABLE IF NOT EXISTS lyrics (
+    key TEXT PRIMARY KEY,
+    result JSON NOT NULL,
+    ttl TIMESTAMPTZ DEFAULT now() + interval '7 days'
+);
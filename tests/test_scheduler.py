@@ -0,0 +1,39 @@
+import asyncio
+
+from core.scheduler import JobScheduler
+
+
+def test_round_robin_after_finished_job():
+    # Concurrency 1 with A1 running and A2, B1, C1 queued: A2 is reported last and starts last.
+    async def main():
+        scheduler = JobScheduler({"p": 1}, max_per_user=2)
+        started = []
+        positions = {}
+        release = {name: asyncio.Event() for name in ("A1", "A2", "B1", "C1")}
+
+        async def job(name, user_id):
+            async def on_position(position):
+                positions[name] = position
+
+            async with scheduler.slot("p", user_id, on_position=on_position):
+                started.append(name)
+                await release[name].wait()
+
+        tasks = []
+
+        for name, user_id in (("A1", 1), ("A2", 1), ("B1", 2), ("C1", 3)):
+            tasks.append(asyncio.create_task(job(name, user_id)))
+            await asyncio.sleep(0)
+
+        await asyncio.sleep(0)
+        assert started == ["A1"]
+        assert positions == {"A2": 3, "B1": 1, "C1": 2}
+
+        for name in ("A1", "B1", "C1", "A2"):
+            release[name].set()
+            await asyncio.sleep(0.01)
+
+        await asyncio.gather(*tasks)
+        assert started == ["A1", "B1", "C1", "A2"]
+
+    asyncio.run(main())
@@ -2,12 +2,26 @@ import discord
 from discord.ext import commands
 from discord.ext.menus import ListPageSource as MenuSource
 
+from core.cdn import thumbnail_url
 from core.image import GeneratedImage as Image
 from core.image.style import GeneratedImage as StyleImage
-from utils.paginator import YodaMenuPages
+from utils.paginator import AppendablePageSource, YodaMenuPages
 
 
-class DalleImagesPaginator(MenuSource):
+def set_preview(embed: discord.Embed, url: str) -> discord.Embed:
+    """
+    Show the CDN thumbnail of the image (if it has one) with a link to the full resolution one.
+    """
+    if thumbnail := thumbnail_url(url):
+        embed.set_image(url=thumbnail)
+        embed.add_field(name="Full Resolution:", value=f"[Open]({url})")
+    else:
+        embed.set_image(url=url)
+
+    return embed
+
+
+class DalleImagesPaginator(AppendablePageSource):
     def __init__(self, entries, text, prompt=None):
         super().__init__(entries, per_page=1)
 
@@ -16,7 +30,7 @@ class DalleImagesPaginator(MenuSource):
 
     async def format_page(self, menu: YodaMenuPages, image: Image):
         embed = discord.Embed(color=menu.ctx.bot.color)
-        embed.set_image(url=image.url)
+        set_preview(embed, image.url)
         embed.set_author(
             name=f"{(self.text + ' ') if self.text else ''}Result:",
             icon_url=menu.ctx.author.display_avatar.url,
@@ -33,7 +47,7 @@ class DalleImagesPaginator(MenuSource):
         return embed
 
 
-class DalleArtPaginator(MenuSource):
+class DalleArtPaginator(AppendablePageSource):
     def __init__(self, entries, prompt=None):
         super().__init__(entries, per_page=1)
 
@@ -41,7 +55,7 @@ class DalleArtPaginator(MenuSource):
 
     async def format_page(self, menu: YodaMenuPages, image: StyleImage):
         embed = discord.Embed(color=menu.ctx.bot.color)
-        embed.set_image(url=image.result)
+        set_preview(embed, image.result)
         embed.set_author(
             name=f"Image Generation (Style) Result:",
             icon_url=menu.ctx.author.display_avatar.url,
@@ -66,7 +80,7 @@ class MidjourneyPaginator(MenuSource):
 
     async def format_page(self, menu: YodaMenuPages, image: list[str]):
         embed = discord.Embed(color=menu.ctx.bot.color)
-        embed.set_image(url=image)
+        set_preview(embed, image)
         embed.set_author(
             name=f"Midjourney Result:",
             icon_url=menu.ctx.author.display_avatar.url,
@@ -83,7 +97,7 @@ class MidjourneyPaginator(MenuSource):
         return embed
 
 
-class FireflyTextToImagePaginator(MenuSource):
+class FireflyTextToImagePaginator(AppendablePageSource):
     def __init__(self, entries, prompt=None, res_high=False):
         super().__init__(entries, per_page=1)
 
@@ -92,7 +106,7 @@ class FireflyTextToImagePaginator(MenuSource):
 
     async def format_page(self, menu: YodaMenuPages, image: list[str]):
         embed = discord.Embed(color=menu.ctx.bot.color)
-        embed.set_image(url=image)
+        set_preview(embed, image)
         embed.set_author(
             name=f"Adobe Firefly Result:",
             icon_url=menu.ctx.author.display_avatar.url,
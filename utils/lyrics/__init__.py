@@ -1,46 +1,49 @@
-from dataclasses import asdict, dataclass, field
-
 import discord
-from discord.ext.commands import Paginator
 from discord.ext.menus import ListPageSource as MenuSource
 
 from core.music import LyricResult
 from utils.paginator import YodaMenuPages
 
 
-@dataclass(frozen=True, eq=True)
-class PaginatedLyricResult:
-    title: str = None
-    artist: str = None
-    lyrics: str = None
-    paginated_lyrics: str = None
-    images: dict[str, str] = field(default_factory=dict)
-
+def paginate_lyric_result(
+    res: LyricResult, limit: int = 4000
+) -> list[tuple[int, int]]:
+    """
+    Split the lyrics into pages of at most `limit` characters, breaking on lines where possible.
 
-def paginate_lyric_result(res: LyricResult, limit: int = 4000):
-    pag = Paginator(prefix="", suffix="", max_size=limit)
+    Pages are `(start, end)` offsets into `res.lyrics`, so nothing is copied until a page is shown.
+    """
+    lyrics = res.lyrics or ""
+    pages = []
+    start = 0
 
-    for line in res.lyrics.split("\n"):
-        pag.add_line(line)
+    while start < len(lyrics):
+        end = min(start + limit, len(lyrics))
 
-    pages = []
+        if end < len(lyrics) and (cut := lyrics.rfind("\n", start, end + 1)) > start:
+            end = cut
 
-    for page in pag.pages:
-        pag_res = PaginatedLyricResult(**asdict(res), paginated_lyrics=page)
+        pages.append((start, end))
 
-        pages.append(pag_res)
+        # Skip the newline we broke on
+        start = end + 1 if end < len(lyrics) and lyrics[end] == "\n" else end
 
     return pages
 
 
 class LyricsPaginator(MenuSource):
-    def __init__(self, entries):
-        super().__init__(entries, per_page=1)
+    def __init__(self, res: LyricResult, *, limit: int = 4000):
+        self.res = res
+
+        super().__init__(paginate_lyric_result(res, limit), per_page=1)
+
+    async def format_page(self, menu: YodaMenuPages, page: tuple[int, int]):
+        res = self.res
+        start, end = page
 
-    async def format_page(self, menu: YodaMenuPages, res: PaginatedLyricResult):
         embed = discord.Embed(color=menu.ctx.bot.color)
         embed.title = res.title or "Title Unavailable."
-        embed.description = res.paginated_lyrics
+        embed.description = res.lyrics[start:end]
         embed.set_thumbnail(url=res.images.get("track"))
         embed.set_footer(text="Powered by Yoda API")
 
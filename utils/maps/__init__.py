@@ -8,6 +8,9 @@ import discord
 from discord import ui
 from discord.ext.menus import ListPageSource as MenuSource
 
+from core.cdn import CDN
+from core.image.preprocess import ImagePreprocessor
+from utils.image import set_preview
 from utils.paginator import YodaMenuPages
 
 if TYPE_CHECKING:
@@ -32,21 +35,22 @@ class PhotosPaginator(MenuSource):
         return l
 
     async def format_page(self, menu: YodaMenuPages, page: dict):
-        if page["photo_reference"] in self.cls.photos_cache:
-            image = self.cls.photos_cache[page["photo_reference"]]
-        else:
-            image = await self.cls.maps.get_photo(page["photo_reference"])
-            self.cls.photos_cache[page["photo_reference"]] = image
+        ref = page["photo_reference"]
 
-        key = f"maps/{self.cls.place_id}/{page['photo_reference']}.png"
-        menu.ctx.client.cdn.put_object(Body=image, Bucket="yodabot", Key=key)
-        url = f"https://cdn.yodabot.xyz/{key}"
+        # Uploaded once per photo, then the CDN URL is reused when going back to the page.
+        if (url := self.cls.photos_cache.get(ref)) is None:
+            image = await self.cls.maps.get_photo(ref)
+
+            url = await self.cls.get_cdn(menu.ctx.client).upload_image(
+                image, f"maps/{self.cls.place_id}/{ref}"
+            )
+            self.cls.photos_cache[ref] = url
 
         authors = self.parse_attributons(page["html_attributions"])
 
         embed = discord.Embed(color=menu.ctx.client.color)
         embed.title = "Photos:"
-        embed.set_image(url=url)
+        set_preview(embed, url)
         embed.set_footer(text="Photo by: " + ", ".join(authors))
 
         return embed
@@ -67,7 +71,8 @@ class MapsView(ui.View):
         self.landscape_aerial_view = landscape_aerial_view
         self.portrait_aerial_view = portrait_aerial_view
 
-        self.photos_cache = {}
+        self.photos_cache = {}  # photo reference -> CDN URL
+        self.cdn = None
 
         self.menu = self.generate_menu()
 
@@ -79,6 +84,17 @@ class MapsView(ui.View):
         if not all(self.portrait_aerial_view):
             self.remove_item(self.show_portrait)
 
+    def get_cdn(self, bot) -> CDN:
+        if self.cdn is None:
+            self.cdn = CDN(
+                bot.cdn,
+                "yodabot",
+                "https://cdn.yodabot.xyz",
+                preprocessor=ImagePreprocessor(),
+            )
+
+        return self.cdn
+
     def generate_menu(self):
         source = PhotosPaginator(self, self.photos)
         menu = YodaMenuPages(source)
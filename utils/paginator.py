@@ -5,6 +5,18 @@ from discord.ext import commands, menus
 from core.context import Context
 
 
+class AppendablePageSource(menus.ListPageSource):
+    """A ListPageSource that can get more entries after the menu started, see `YodaMenuPages.add_entry`"""
+
+    def append(self, entry):
+        self.entries.append(entry)
+
+    def get_max_pages(self):
+        # Worked out from the entries every time, so appended ones are counted.
+        pages, left_over = divmod(len(self.entries), self.per_page)
+        return pages + bool(left_over)
+
+
 class YodaMenuPages(ui.View, menus.MenuPages):
     def __init__(
         self,
@@ -45,6 +57,13 @@ class YodaMenuPages(ui.View, menus.MenuPages):
         self.message = await self.send_initial_message(ctx, channel)
         await self.update_buttons()
 
+    async def add_entry(self, entry):
+        """Add a page to a running menu (AppendablePageSource), e.g. when results are streamed in"""
+        self._source.append(entry)
+
+        if not self.is_finished():
+            await self.update_buttons()
+
     async def _get_kwargs_from_page(self, page):
         """This method calls ListPageSource.format_page class"""
         value = await super()._get_kwargs_from_page(page)